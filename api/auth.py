@@ -1,17 +1,28 @@
+import asyncio
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
+import os
+import threading
+import time
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
-import firebase_admin
 from firebase_admin import auth as firebase_auth
 
+from metrics import span
+
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # In production, use a secure secret key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Verified-token cache configuration
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class Token(BaseModel):
@@ -22,6 +33,87 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     sub: Optional[str] = None
 
+class VerifiedTokenCache:
+    """Bounded LRU of tokens whose user has already been checked in Firebase.
+
+    An entry lives until the earlier of the cache TTL and the token's own
+    ``exp`` claim. If a revocation hook is set it is consulted on every
+    request and a revoked user's entries are evicted.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE, ttl: int = TOKEN_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revocation_hook: Optional[Callable[[str], bool]] = None
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def is_revoked(self, user_id: str) -> bool:
+        if self.revocation_hook and self.revocation_hook(user_id):
+            self.invalidate_user(user_id)
+            return True
+        return False
+
+    def put(self, token: str, user_id: str, token_expires_at: float):
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self._lock:
+            self._entries[token] = (user_id, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            for token in [t for t, (uid, _) in self._entries.items() if uid == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+token_cache = VerifiedTokenCache()
+
+def set_revocation_hook(hook: Optional[Callable[[str], bool]]):
+    """Register ``hook(user_id) -> bool``; returning True rejects that user's tokens."""
+    token_cache.revocation_hook = hook
+
+# In-flight Firebase lookups, so a burst of cache misses for one user shares a call
+_pending_lookups: Dict[str, asyncio.Future] = {}
+
+async def _get_firebase_user(user_id: str):
+    with span("auth", "get_user"):
+        return await run_in_threadpool(firebase_auth.get_user, user_id)
+
+async def _lookup_firebase_user(user_id: str):
+    lookup = _pending_lookups.get(user_id)
+    if lookup is None:
+        lookup = asyncio.ensure_future(_get_firebase_user(user_id))
+        _pending_lookups[user_id] = lookup
+        lookup.add_done_callback(lambda _: _pending_lookups.pop(user_id, None))
+    return await asyncio.shield(lookup)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -45,9 +137,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
         if user_id is None:
             raise credentials_exception
         
+        if token_cache.is_revoked(user_id):
+            raise credentials_exception
+        if token_cache.get(token) == user_id:
+            return user_id
+
         # Verify the user exists in Firebase
         try:
-            firebase_auth.get_user(user_id)
+            await _lookup_firebase_user(user_id)
         except firebase_auth.UserNotFoundError:
             raise credentials_exception
         except Exception as e:
@@ -55,10 +152,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Firebase auth error: {str(e)}"
             )
-            
+
+        token_cache.put(token, user_id, payload.get("exp", 0))
         return user_id
     except JWTError:
         raise credentials_exception
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -68,7 +168,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
 def verify_firebase_token(id_token: str) -> dict:
     """Verify Firebase ID token and return user claims"""
     try:
-        decoded_token = firebase_auth.verify_id_token(id_token)
+        with span("auth", "verify_id_token"):
+            decoded_token = firebase_auth.verify_id_token(id_token)
         return decoded_token
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,80 @@
+"""Poll payload of a delta sync vs re-fetching the shopping list and preferences.
+
+Fills a user's list with ``--items`` items, syncs once, then makes
+``--changes`` mutations (a mix of checks, additions and deletions) and
+compares what a client downloads to catch up:
+
+* ``refetch`` - ``GET /api/shopping-list`` + ``GET /api/preferences``
+* ``delta``   - ``GET /api/sync?since=<syncedAt of the previous sync>``
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.delta_sync --items 200 --changes 3 --storage sql
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeAsyncFirestore
+from benchmarks.harness import load_app
+
+
+async def download(client: httpx.AsyncClient, *requests):
+    """Total body bytes and latency in milliseconds of ``requests`` (path, params)."""
+    from response_cache import response_cache
+
+    response_cache.clear()
+    size = 0
+    start = time.perf_counter()
+    for path, params in requests:
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        size += len(response.content)
+    return size, (time.perf_counter() - start) * 1000
+
+
+async def run(args):
+    app = load_app(FakeAsyncFirestore(latency=args.latency))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        await client.put('/api/preferences', json={'about': 'Bench', 'targets': {'calories': 2000, 'protein': 80}})
+        ids = (await client.post('/api/shopping-list/bulk', json=[
+            {'name': f'Item {i}', 'quantity': i, 'category': 'Produce', 'checked': False}
+            for i in range(args.items)
+        ])).json()['ids']
+        since = (await client.get('/api/sync')).json()['syncedAt']
+        # The first delta query imports the Firestore query types
+        await client.get('/api/sync', params={'since': since})
+        # Writes must land after since, past the clock skew allowance
+        await asyncio.sleep(float(os.environ['SYNC_CLOCK_SKEW_SECONDS']) + 0.01)
+
+        for i in range(args.changes):
+            if i % 3 == 0:
+                await client.put(f'/api/shopping-list/{ids[i]}', json={'checked': True})
+            elif i % 3 == 1:
+                await client.post('/api/shopping-list', json={'name': f'New {i}', 'category': 'Dairy', 'checked': False})
+            else:
+                await client.delete(f'/api/shopping-list/{ids[i]}')
+
+        refetch = await download(client, ('/api/shopping-list', None), ('/api/preferences', None))
+        delta = await download(client, ('/api/sync', {'since': since}))
+        print(f'storage={args.storage} items={args.items} changes={args.changes}')
+        print(f'{"refetch":<8} {refetch[0]:>9} bytes {refetch[1]:>8.1f}ms')
+        print(f'{"delta":<8} {delta[0]:>9} bytes {delta[1]:>8.1f}ms  ({refetch[0] / delta[0]:.0f}x smaller)')
+
+
+def main(args):
+    os.environ['STORAGE_BACKEND'] = args.storage
+    os.environ.setdefault('SYNC_CLOCK_SKEW_SECONDS', '0')
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--changes', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='FakeAsyncFirestore round trip latency (s)')
+    parser.add_argument('--storage', choices=['firestore', 'sql'], default='firestore')
+    main(parser.parse_args())
@@ -0,0 +1,303 @@
+"""In-memory stand-ins for the external services used by the API.
+
+The fakes mimic just enough of the ``google.cloud.firestore`` async client
+surface for ``FirestoreDB`` to run unchanged. Every round trip sleeps for a
+configurable latency; with ``blocking=True`` the sleep is a ``time.sleep``,
+which reproduces a sync client called from inside ``async def`` handlers.
+``FakeFirebaseAuth`` does the same for the (synchronous) ``firebase_auth``
+module.
+"""
+import asyncio
+import copy
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client: "FakeAsyncFirestore", path: Tuple[str, ...]):
+        self._client = client
+        self._path = path
+
+    @property
+    def id(self) -> str:
+        return self._path[-1]
+
+    @property
+    def path(self) -> str:
+        return '/'.join(self._path)
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, self._path + (name,))
+
+    async def get(self) -> FakeDocumentSnapshot:
+        await self._client.round_trip()
+        return FakeDocumentSnapshot(self, self._client.documents.get(self._path))
+
+    async def set(self, data: Dict, merge: bool = False):
+        await self._client.round_trip()
+        existing = self._client.documents.get(self._path)
+        if merge and existing is not None:
+            data = existing | data
+        self._client.documents[self._path] = copy.deepcopy(data)
+
+    async def update(self, data: Dict):
+        await self._client.round_trip()
+        if self._path not in self._client.documents:
+            raise KeyError(f"No document to update: {self.path}")
+        self._client.documents[self._path].update(copy.deepcopy(data))
+
+    async def delete(self):
+        await self._client.round_trip()
+        self._client.documents.pop(self._path, None)
+
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeAsyncFirestore", path: Tuple[str, ...], filters=(), orders=(),
+                 start_after=None, limit=None, projection=None):
+        self._client = client
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._start_after = start_after
+        self._limit = limit
+        self._projection = projection
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = dict(filters=self._filters, orders=self._orders, start_after=self._start_after,
+                     limit=self._limit, projection=self._projection)
+        return FakeQuery(self._client, self._path, **(state | changes))
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING') -> "FakeQuery":
+        if direction != 'ASCENDING':
+            raise NotImplementedError("FakeQuery only orders ascending")
+        return self._copy(orders=self._orders + (field_path,))
+
+    def start_after(self, values) -> "FakeQuery":
+        return self._copy(start_after=tuple(values))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def select(self, field_paths) -> "FakeQuery":
+        return self._copy(projection=tuple(field_paths))
+
+    def _matches(self, data: Dict) -> bool:
+        return all(_OPERATORS[op](data.get(field), value) for field, op, value in self._filters)
+
+    def _sort_key(self, path: Tuple[str, ...], data: Dict) -> tuple:
+        return tuple(path[-1] if field == '__name__' else data[field] for field in self._orders)
+
+    async def stream(self):
+        await self._client.round_trip()
+        results = [
+            (path, data) for path, data in list(self._client.documents.items())
+            if path[:-1] == self._path and self._matches(data)
+        ]
+        if self._orders:
+            # Like Firestore, documents without an ordered field are left out
+            results = [
+                (path, data) for path, data in results
+                if all(field == '__name__' or field in data for field in self._orders)
+            ]
+            results.sort(key=lambda result: self._sort_key(*result))
+            if self._start_after is not None:
+                results = [result for result in results if self._sort_key(*result) > self._start_after]
+        if self._limit is not None:
+            results = results[:self._limit]
+        for path, data in results:
+            if self._projection is not None:
+                data = {field: data[field] for field in self._projection if field in data}
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._client, path), data)
+
+
+class FakeCollectionReference(FakeQuery):
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._path + (document_id or uuid.uuid4().hex,))
+
+    async def list_documents(self):
+        await self._client.round_trip()
+        for path in list(self._client.documents):
+            if path[:-1] == self._path:
+                yield FakeDocumentReference(self._client, path)
+
+
+class FakeWriteBatch:
+    """Queues writes and applies them all in a single round trip on commit."""
+
+    def __init__(self, client: "FakeAsyncFirestore"):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict, merge: bool = False):
+        self._writes.append(('set', reference, data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: Dict):
+        self._writes.append(('update', reference, data, False))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append(('delete', reference, None, False))
+
+    async def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A write batch can contain at most 500 operations")
+        await self._client.round_trip()
+        documents = self._client.documents
+        for op, reference, data, merge in self._writes:
+            path = reference._path
+            if op == 'delete':
+                documents.pop(path, None)
+            elif op == 'update':
+                if path not in documents:
+                    raise KeyError(f"No document to update: {reference.path}")
+                documents[path].update(copy.deepcopy(data))
+            elif merge and path in documents:
+                documents[path] = documents[path] | copy.deepcopy(data)
+            else:
+                documents[path] = copy.deepcopy(data)
+        self._writes = []
+
+
+class FakeAsyncFirestore:
+    """Dict-backed replacement for ``firestore_async.client()``."""
+
+    def __init__(self, latency: float = 0.01, blocking: bool = False):
+        self.latency = latency
+        self.blocking = blocking
+        self.documents: Dict[Tuple[str, ...], Dict] = {}
+        self.round_trips = 0
+
+    async def round_trip(self):
+        self.round_trips += 1
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, (name,))
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+
+
+class FakeUserRecord:
+    def __init__(self, uid: str, email: str, display_name: Optional[str] = None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.disabled = False
+
+
+class FakeFirebaseAuth:
+    """Replacement for ``firebase_admin.auth`` with users kept in memory."""
+
+    class UserNotFoundError(Exception):
+        pass
+
+    class EmailAlreadyExistsError(Exception):
+        pass
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.users: Dict[str, FakeUserRecord] = {}
+        self.calls = 0
+
+    def _round_trip(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def create_user(self, email: str, password: str, display_name: Optional[str] = None) -> FakeUserRecord:
+        self._round_trip()
+        if any(user.email == email for user in self.users.values()):
+            raise self.EmailAlreadyExistsError(email)
+        user = FakeUserRecord(uuid.uuid4().hex, email, display_name)
+        self.users[user.uid] = user
+        return user
+
+    def get_user(self, uid: str) -> FakeUserRecord:
+        self._round_trip()
+        if uid not in self.users:
+            raise self.UserNotFoundError(uid)
+        return self.users[uid]
+
+    def get_user_by_email(self, email: str) -> FakeUserRecord:
+        self._round_trip()
+        for user in self.users.values():
+            if user.email == email:
+                return user
+        raise self.UserNotFoundError(email)
+
+    def create_custom_token(self, uid: str) -> bytes:
+        return f"custom-token-{uid}".encode()
+
+    def verify_id_token(self, id_token: str) -> Dict:
+        self._round_trip()
+        return {"uid": id_token}
+
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MEALS = ['breakfast', 'lunch', 'dinner']
+
+_INGREDIENTS = [
+    '1 cup basmati rice', '200g paneer', '1 tbsp ghee', '1/2 tsp turmeric', '1 tsp cumin seeds',
+    '2 cloves garlic, minced', '1 inch ginger, grated', '1 cup spinach', '1/2 cup yellow moong dal',
+    '1 medium onion, chopped', '2 tomatoes, diced', 'Salt to taste',
+]
+
+
+def sample_meal(name: str, ingredients: int = 8, steps: int = 6) -> Dict:
+    """A meal shaped like the model output, with realistic field sizes."""
+    return {
+        'recipe': name,
+        'prepTime': '25 mins',
+        'calories': 550,
+        'protein': 30,
+        'image': 'https://images.unsplash.com/photo-1512621776951-a57141f2eefd',
+        'ayurvedic': 'Balances Pitta and Vata; warming spices support digestion',
+        'ingredients': [_INGREDIENTS[i % len(_INGREDIENTS)] for i in range(ingredients)],
+        'instructions': [
+            f'Step {i + 1}: heat the ghee, add the spices and cook the ingredients '
+            f'over medium heat, stirring occasionally, for about {5 + i} minutes.'
+            for i in range(steps)
+        ],
+    }
+
+
+def sample_meal_plan(ingredients: int = 8, steps: int = 6) -> Dict:
+    return {'weeklyPlan': {
+        day: {meal: sample_meal(f'{day} {meal}', ingredients, steps) for meal in MEALS}
+        for day in DAYS
+    }}
@@ -0,0 +1,74 @@
+"""Concurrency benchmark for the Firestore read endpoints.
+
+Fires many simultaneous requests at ``/api/meal-plan`` and
+``/api/shopping-list`` and reports latency percentiles. Three backends:
+
+* ``async``    - in-memory fake whose round trips yield to the event loop
+* ``blocking`` - the same fake, but round trips ``time.sleep`` like the old
+                 sync client did inside ``async def`` handlers
+* ``emulator`` - a real ``AsyncClient`` against ``FIRESTORE_EMULATOR_HOST``
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.firestore_concurrency --mode blocking
+    python -m benchmarks.firestore_concurrency --mode async
+"""
+import argparse
+import asyncio
+import os
+
+import httpx
+
+from benchmarks.fakes import FakeAsyncFirestore, sample_meal_plan
+from benchmarks.harness import BENCH_USER, format_row, load_app, run_concurrent
+
+
+def make_db(mode: str, latency: float):
+    if mode == 'emulator':
+        if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+            raise SystemExit('FIRESTORE_EMULATOR_HOST must be set for --mode emulator')
+        from google.cloud import firestore
+        return firestore.AsyncClient(project=os.getenv('GCLOUD_PROJECT', 'vital-bites-bench'))
+    return FakeAsyncFirestore(latency=latency, blocking=mode == 'blocking')
+
+
+async def seed(items: int):
+    from firestore_db import FirestoreDB
+
+    await FirestoreDB.save_meal_plan(BENCH_USER, sample_meal_plan())
+    await FirestoreDB.clear_shopping_list(BENCH_USER)
+    for i in range(items):
+        await FirestoreDB.add_shopping_item(BENCH_USER, {'name': f'item {i}', 'checked': False})
+
+
+async def main(args):
+    db = make_db(args.mode, args.latency / 1000)
+    app = load_app(db)
+    if not args.response_cache:
+        # Measure Firestore itself rather than the in-process response cache
+        from response_cache import response_cache
+        response_cache.ttl = 0
+    await seed(args.items)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        print(f"mode={args.mode} latency={args.latency}ms requests={args.requests} "
+              f"concurrency={args.concurrency}")
+        for path in ('/api/meal-plan', '/api/shopping-list'):
+            async def request():
+                response = await client.get(path)
+                response.raise_for_status()
+
+            stats = await run_concurrent(request, args.requests, args.concurrency)
+            print(format_row(path, stats))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['async', 'blocking', 'emulator'], default='async')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=10.0, help='simulated round trip in ms')
+    parser.add_argument('--items', type=int, default=50, help='shopping list size to seed')
+    parser.add_argument('--response-cache', action='store_true', help='keep the ETag response cache on')
+    asyncio.run(main(parser.parse_args()))
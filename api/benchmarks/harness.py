@@ -0,0 +1,103 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks are run from the ``api`` directory, e.g.
+``python -m benchmarks.firestore_concurrency``, so the application modules
+import exactly as they do under uvicorn.
+"""
+import asyncio
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+BENCH_USER = 'bench-user'
+
+
+def use_temp_database() -> str:
+    """Point the SQL database at a fresh SQLite file unless ``ASYNC_DATABASE_URL`` is set.
+
+    The recipe library and ``STORAGE_BACKEND=sql`` write there, so a run
+    neither reads nor grows ``./vital_bites.db``; the file is removed at
+    exit. Has to run before ``database`` is imported; ``load_app`` does it
+    first.
+    """
+    if 'ASYNC_DATABASE_URL' not in os.environ:
+        directory = tempfile.mkdtemp(prefix='bench-')
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        os.environ['ASYNC_DATABASE_URL'] = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+    return os.environ['ASYNC_DATABASE_URL']
+
+
+def load_app(db, user_id: Optional[str] = BENCH_USER, firebase_auth=None):
+    """Import ``main.app`` wired to ``db`` instead of a real Firestore client.
+
+    Setting ``firestore_db.db`` up front makes the lifespan's
+    ``init_firebase`` a no-op, so no service account or network access is
+    needed. With a ``user_id`` ``get_current_user`` is overridden to that
+    fixed user; otherwise requests authenticate for real against
+    ``firebase_auth``. SQL tables go to a temporary database.
+    """
+    use_temp_database()
+    import firestore_db
+    import main
+    firestore_db.db = db
+    if firebase_auth is not None:
+        import auth
+        auth.firebase_auth = firebase_auth
+        main.firebase_auth = firebase_auth
+    if user_id is not None:
+        main.app.dependency_overrides[main.get_current_user] = lambda: user_id
+    return main.app
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float], elapsed: float) -> Dict[str, float]:
+    """Latency summary in milliseconds plus throughput in requests/second."""
+    return {
+        'count': len(samples),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'mean': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50': percentile(samples, 50) * 1000,
+        'p95': percentile(samples, 95) * 1000,
+        'p99': percentile(samples, 99) * 1000,
+    }
+
+
+async def run_concurrent(
+    request: Callable[[], Awaitable[None]],
+    total: int,
+    concurrency: int,
+) -> Dict[str, float]:
+    """Issue ``total`` calls of ``request`` with at most ``concurrency`` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            await request()
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(total)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def format_row(name: str, stats: Dict[str, float], baseline: Optional[Dict[str, float]] = None) -> str:
+    row = (
+        f"{name:<32} n={stats['count']:<6} rps={stats['rps']:>8.1f} "
+        f"p50={stats['p50']:>8.1f}ms p95={stats['p95']:>8.1f}ms p99={stats['p99']:>8.1f}ms"
+    )
+    if baseline and baseline.get('p99'):
+        row += f"  p99 vs baseline {stats['p99'] / baseline['p99'] - 1:+.0%}"
+    return row
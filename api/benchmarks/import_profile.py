@@ -0,0 +1,122 @@
+"""Cold-start profile: ``python -X importtime`` for ``import main``.
+
+Imports the app in fresh interpreters and reports the median total import
+time, the direct imports of ``main`` and the slowest modules by self time.
+With ``--serve`` it also starts uvicorn and measures the time until
+``/healthz`` first answers, which is what a Cloud Run startup probe sees.
+The exit status is 1 when the median import time misses ``--target``.
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.import_profile --runs 5 --serve
+    python -m benchmarks.import_profile --output benchmarks/import_profile.txt
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.harness import use_temp_database
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_import(module: str) -> List[Tuple[int, str, float, float]]:
+    """``(depth, module, self seconds, cumulative seconds)`` for one fresh import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=API_DIR, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((len(indent) // 2, name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return rows
+
+
+def time_to_healthz(port: int, timeout: float = 30.0) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"/healthz did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def report(args) -> Tuple[str, float]:
+    totals = []
+    direct: Dict[str, List[float]] = defaultdict(list)
+    self_times: Dict[str, List[float]] = defaultdict(list)
+    for _ in range(args.runs):
+        rows = profile_import(args.module)
+        for depth, name, self_time, cumulative in rows:
+            self_times[name].append(self_time)
+            if depth == 0 and name == args.module:
+                totals.append(cumulative)
+            elif depth == 1:
+                direct[name].append(cumulative)
+
+    total = statistics.median(totals)
+    lines = [
+        f"import {args.module}: median {total * 1000:.0f}ms over {args.runs} runs "
+        f"(target {args.target * 1000:.0f}ms, {'met' if total <= args.target else 'MISSED'})",
+        f"python {sys.version.split()[0]} on {os.cpu_count()} CPU(s)",
+        "",
+        f"Direct imports of {args.module} by cumulative time:",
+    ]
+    for name, values in sorted(direct.items(), key=lambda item: -statistics.median(item[1]))[:args.top]:
+        lines.append(f"  {statistics.median(values) * 1000:8.1f}ms  {name}")
+    lines += ["", "Slowest modules by self time:"]
+    for name, values in sorted(self_times.items(), key=lambda item: -statistics.median(item[1]))[:args.top]:
+        lines.append(f"  {statistics.median(values) * 1000:8.1f}ms  {name}")
+    if args.serve:
+        startup = statistics.median(time_to_healthz(free_port()) for _ in range(args.runs))
+        lines += ["", f"process start to first /healthz response: median {startup * 1000:.0f}ms"]
+    return "\n".join(lines) + "\n", total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--target", type=float, default=1.0, help="seconds")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn until /healthz answers")
+    parser.add_argument("--output", help="also write the report to this path")
+    args = parser.parse_args()
+
+    # The servers inherit it, so their warm-up loads the library from a scratch file
+    use_temp_database()
+    text, total = report(args)
+    print(text, end="")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    sys.exit(0 if total <= args.target else 1)
@@ -0,0 +1,339 @@
+"""End-to-end load test of the API against local stand-ins.
+
+Every external dependency is replaced in-process: Firestore by
+``FakeAsyncFirestore`` (or, with ``--storage sql``, a temporary SQLite
+database), ``firebase_auth`` by ``FakeFirebaseAuth`` and OpenAI by
+``benchmarks.mock_openai``, each with configurable latency. Virtual users
+register, log in and then issue a weighted mix of requests through the full
+middleware stack, with real bearer tokens. Per endpoint the run reports
+throughput, error count and p50/p95/p99 latency.
+
+Any response outside 2xx/3xx and ``EXPECTED_STATUSES`` counts as an error,
+and a run with errors exits with status 1. Results can be saved as a
+baseline, but only from a run without errors. Later runs are compared
+against it and also exit with status 1 when any endpoint's p95 regresses by
+more than ``--max-regression`` or its error count or rate grows. Timings are
+machine dependent, so record the baseline on the machine that runs the
+comparison.
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.load_test --mix default --users 50 --duration 20
+    python -m benchmarks.load_test --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load_test --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks import mock_openai
+from benchmarks.fakes import DAYS, MEALS, FakeAsyncFirestore, FakeFirebaseAuth, sample_meal_plan
+from benchmarks.harness import format_row, load_app, summarize
+
+PREFERENCES = {
+    'user_id': 1,
+    'targets': {'calories': 2000, 'protein': 90},
+    'health_focus': {'primary': 'digestion', 'secondary': 'energy'},
+    'dietary_restrictions': ['vegetarian'],
+    'time_availability': {day: {meal: 30 for meal in MEALS} for day in DAYS},
+    'about': 'Busy weekdays, more time to cook on weekends.',
+    'favorite_foods': 'dal, roasted vegetables, oatmeal',
+    'familiarity_level': 60,
+    'cultural_background': ['Indian', 'Mediterranean'],
+}
+
+# Relative weights per scenario; each name is a key of ACTIONS
+MIXES = {
+    'default': {
+        'login': 3, 'me': 8, 'get_meal_plan': 15, 'get_meal_plan_summary': 10, 'get_preferences': 8,
+        'get_shopping_list': 20, 'add_item': 10, 'update_item': 8, 'delete_item': 4, 'bulk_add': 2,
+        'generate': 1, 'submit_job': 1,
+    },
+    'read_heavy': {
+        'me': 10, 'get_meal_plan': 30, 'get_meal_plan_summary': 20, 'get_preferences': 10,
+        'get_shopping_list': 30,
+    },
+    'shopping': {
+        'get_shopping_list': 30, 'add_item': 25, 'update_item': 25, 'delete_item': 10, 'bulk_add': 10,
+    },
+    'generation': {
+        'generate': 4, 'stream': 3, 'submit_job': 3, 'get_meal_plan': 10,
+    },
+}
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, index: int, rng: random.Random):
+        self.client = client
+        self.email = f'load-{index}-{uuid.uuid4().hex[:6]}@example.com'
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        self.item_ids: List[str] = []
+
+    async def setup(self):
+        response = await self.client.post('/register', json={
+            'email': self.email, 'password': 'load-test', 'name': 'Load Test',
+        })
+        response.raise_for_status()
+        # Start from a saved plan, as a returning user would
+        from storage import storage
+        await storage.save_meal_plan(response.json()['id'], sample_meal_plan())
+        response = await self.login()
+        response.raise_for_status()
+        response = await self.client.put('/api/preferences', json=PREFERENCES, headers=self.headers)
+        response.raise_for_status()
+
+    async def login(self) -> httpx.Response:
+        response = await self.client.post('/token', data={'username': self.email, 'password': 'load-test'})
+        if response.status_code == 200:
+            self.headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def me(self):
+        return await self.client.get('/me', headers=self.headers)
+
+    async def get_meal_plan(self):
+        return await self.client.get('/api/meal-plan', headers=self.headers)
+
+    async def get_meal_plan_summary(self):
+        return await self.client.get('/api/meal-plan', params={'view': 'summary'}, headers=self.headers)
+
+    async def get_preferences(self):
+        return await self.client.get('/api/preferences', headers=self.headers)
+
+    async def get_shopping_list(self):
+        return await self.client.get('/api/shopping-list', headers=self.headers)
+
+    async def add_item(self):
+        response = await self.client.post('/api/shopping-list', headers=self.headers, json={
+            'name': f'item {self.rng.randrange(1000)}', 'amount': '1', 'category': 'produce', 'checked': False,
+        })
+        if response.status_code == 200:
+            self.item_ids.append(response.json()['id'])
+        return response
+
+    async def update_item(self):
+        if not self.item_ids:
+            return await self.add_item()
+        item_id = self.rng.choice(self.item_ids)
+        return await self.client.put(f'/api/shopping-list/{item_id}', headers=self.headers,
+                                     json={'checked': self.rng.random() < 0.5})
+
+    async def delete_item(self):
+        if not self.item_ids:
+            return await self.add_item()
+        item_id = self.item_ids.pop(self.rng.randrange(len(self.item_ids)))
+        return await self.client.delete(f'/api/shopping-list/{item_id}', headers=self.headers)
+
+    async def bulk_add(self):
+        items = [{'name': f'bulk item {i}', 'amount': '2', 'category': 'pantry', 'checked': False}
+                 for i in range(10)]
+        response = await self.client.post('/api/shopping-list/bulk', headers=self.headers, json=items)
+        if response.status_code == 200:
+            self.item_ids.extend(response.json()['ids'])
+        return response
+
+    async def generate(self):
+        return await self.client.post('/api/meal-plan/generate', headers=self.headers, json=PREFERENCES,
+                                      params={'force_refresh': self.rng.random() < 0.5})
+
+    async def stream(self):
+        async with self.client.stream('POST', '/api/meal-plan/generate/stream', headers=self.headers,
+                                      json=PREFERENCES) as response:
+            await response.aread()
+        return response
+
+    async def submit_job(self):
+        return await self.client.post('/api/meal-plan/jobs', headers=self.headers, json=PREFERENCES)
+
+
+ACTIONS = {
+    'login': VirtualUser.login,
+    'me': VirtualUser.me,
+    'get_meal_plan': VirtualUser.get_meal_plan,
+    'get_meal_plan_summary': VirtualUser.get_meal_plan_summary,
+    'get_preferences': VirtualUser.get_preferences,
+    'get_shopping_list': VirtualUser.get_shopping_list,
+    'add_item': VirtualUser.add_item,
+    'update_item': VirtualUser.update_item,
+    'delete_item': VirtualUser.delete_item,
+    'bulk_add': VirtualUser.bulk_add,
+    'generate': VirtualUser.generate,
+    'stream': VirtualUser.stream,
+    'submit_job': VirtualUser.submit_job,
+}
+
+# Statuses that are expected outcomes rather than failures (no plan saved yet, shed load)
+EXPECTED_STATUSES = {404, 429}
+
+
+async def run_user(user: VirtualUser, mix: Dict[str, int], deadline: float, think_time: float,
+                   samples: Dict[str, List[float]], errors: Dict[str, int], statuses: Dict[str, Dict[int, int]]):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        name = user.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await ACTIONS[name](user)
+            status_code = response.status_code
+        except Exception:
+            status_code = 0
+        samples[name].append(time.perf_counter() - start)
+        statuses[name][status_code] += 1
+        if status_code == 0 or (status_code >= 400 and status_code not in EXPECTED_STATUSES):
+            errors[name] += 1
+        if think_time:
+            await asyncio.sleep(user.rng.expovariate(1 / think_time))
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    if not args.admission_limits:
+        # The load test exercises the endpoints themselves, not the per-user rate limit
+        os.environ.setdefault('LLM_RATE_LIMIT_PER_MINUTE', '100000')
+        os.environ.setdefault('LLM_RATE_LIMIT_BURST', '100000')
+
+    # With sql, load_app's temporary SQLite file is the store; --db-latency applies to Firestore only
+    os.environ['STORAGE_BACKEND'] = args.storage
+
+    db = FakeAsyncFirestore(latency=args.db_latency / 1000)
+    firebase_auth = FakeFirebaseAuth(latency=args.auth_latency / 1000)
+    app = load_app(db, user_id=None, firebase_auth=firebase_auth)
+
+    import main
+    import openai_service
+    mock_app = mock_openai.create_app(args.llm_latency / 1000, args.tokens_per_second)
+    openai_service._async_client = mock_openai.client(mock_app)
+
+    rng = random.Random(args.seed)
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    transport = httpx.ASGITransport(app=app)
+    async with main.lifespan(app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://load', timeout=None) as client:
+            users = [VirtualUser(client, i, random.Random(rng.random())) for i in range(args.users)]
+            await asyncio.gather(*(user.setup() for user in users))
+
+            mix = MIXES[args.mix]
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*(
+                run_user(user, mix, deadline, args.think_time / 1000, samples, errors, statuses)
+                for user in users
+            ))
+            elapsed = time.perf_counter() - start
+
+    results = {}
+    for name in sorted(samples):
+        results[name] = summarize(samples[name], elapsed) | {
+            'errors': errors[name],
+            'statuses': {str(code): count for code, count in sorted(statuses[name].items())},
+        }
+    all_samples = [sample for values in samples.values() for sample in values]
+    results['total'] = summarize(all_samples, elapsed) | {'errors': sum(errors.values())}
+    print(f"mix={args.mix} users={args.users} duration={args.duration}s db={args.db_latency}ms "
+          f"auth={args.auth_latency}ms llm={args.llm_latency}ms+{args.tokens_per_second:g}tok/s "
+          f"upstream completions={mock_app.state.stats.requests}")
+    return results
+
+
+def error_rate(stats: Dict) -> float:
+    return stats['errors'] / stats['count'] if stats['count'] else 0.0
+
+
+def unexpected_errors(results: Dict) -> List[str]:
+    """Endpoints that answered with a status outside 2xx/3xx and ``EXPECTED_STATUSES``."""
+    return [
+        f"{name}: {stats['errors']} errors, statuses {stats['statuses']}"
+        for name, stats in results.items()
+        if name != 'total' and stats['errors']
+    ]
+
+
+def compare(results: Dict, baseline: Dict, max_regression: float, min_delta_ms: float) -> List[str]:
+    """Endpoints with more errors, a higher error rate, or a p95 more than ``max_regression``
+    (and ``min_delta_ms``) above the baseline."""
+    regressions = []
+    for name, stats in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if stats['errors'] > previous.get('errors', 0) or error_rate(stats) > error_rate(previous):
+            regressions.append(
+                f"{name}: errors {previous.get('errors', 0)} ({error_rate(previous):.1%}) -> "
+                f"{stats['errors']} ({error_rate(stats):.1%})"
+            )
+        if not previous.get('p95'):
+            continue
+        delta = stats['p95'] - previous['p95']
+        if delta > min_delta_ms and stats['p95'] > previous['p95'] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['p95']:.1f}ms -> {stats['p95']:.1f}ms")
+    return regressions
+
+
+def report(results: Dict, baseline: Optional[Dict]):
+    for name, stats in results.items():
+        row = format_row(name, stats, baseline.get(name) if baseline else None)
+        print(f"{row}  errors={stats['errors']}")
+
+
+def main(args) -> int:
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+
+    errors = unexpected_errors(results)
+    for error in errors:
+        print(f"ERROR {error}")
+
+    if args.save_baseline and errors:
+        print(f"not writing {args.save_baseline}: a baseline must come from a run without errors")
+    elif args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if 'baseline' not in k},
+                       'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline written to {args.save_baseline}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.max_regression, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--storage', choices=['firestore', 'sql'], default='firestore',
+                        help='STORAGE_BACKEND for the run')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of traffic after setup')
+    parser.add_argument('--think-time', type=float, default=50.0, help='mean pause between requests in ms')
+    parser.add_argument('--db-latency', type=float, default=10.0, help='Firestore round trip in ms')
+    parser.add_argument('--auth-latency', type=float, default=30.0, help='Firebase Auth round trip in ms')
+    parser.add_argument('--llm-latency', type=float, default=500.0, help='time to first token in ms')
+    parser.add_argument('--tokens-per-second', type=float, default=2000.0)
+    parser.add_argument('--admission-limits', action='store_true', help='keep the configured LLM rate limits')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='compare against this baseline JSON')
+    parser.add_argument('--save-baseline', help='write the results to this path')
+    parser.add_argument('--max-regression', type=float, default=0.5, help='allowed p95 increase, e.g. 0.5')
+    parser.add_argument('--min-delta', type=float, default=15.0, help='ignore p95 increases below this many ms')
+    sys.exit(main(parser.parse_args()))
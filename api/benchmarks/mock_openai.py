@@ -0,0 +1,150 @@
+"""A stand-in for the OpenAI chat completions API.
+
+Answers ``POST /v1/chat/completions`` (plain and ``stream=True``) with a
+valid meal plan: the whole ``weeklyPlan`` for the weekly prompt, a single
+day for the per-day prompt and a single meal for the per-meal prompt, cut off at ``max_tokens`` like the real API.
+Each response waits ``latency`` seconds before
+the first token and then produces ``tokens_per_second`` tokens (about four
+characters each), so the API sees realistic generation times without a key.
+
+In-process, wire it up through ``client(app)``. As a standalone server::
+
+    python -m benchmarks.mock_openai --port 8001 --latency 0.5 --tokens-per-second 60
+    OPENAI_BASE_URL=http://localhost:8001/v1 uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from benchmarks.fakes import DAYS, MEALS, sample_meal_plan
+
+CHARS_PER_TOKEN = 4
+# Tokens per streamed chunk, roughly what the API sends
+TOKENS_PER_CHUNK = 4
+
+
+def completion_text(prompt: str) -> str:
+    plan = sample_meal_plan()
+    if "weeklyPlan" in prompt:
+        return json.dumps(plan)
+    for day in DAYS:
+        for meal in MEALS:
+            if f"Create a {meal} for {day}" in prompt:
+                return json.dumps(plan["weeklyPlan"][day][meal])
+    day = next((day for day in DAYS if f"meal plan for {day}" in prompt), DAYS[0])
+    return json.dumps(plan["weeklyPlan"][day])
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class MockOpenAIStats:
+    def __init__(self):
+        self.requests = 0
+        self.streams = 0
+        self.completion_tokens = 0
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "streams": self.streams,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def create_app(latency: float = 0.5, tokens_per_second: float = 60.0) -> Starlette:
+    stats = MockOpenAIStats()
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        text = completion_text(prompt)
+        finish_reason = "stop"
+        if body.get("max_tokens") and count_tokens(text) > body["max_tokens"]:
+            text = text[:body["max_tokens"] * CHARS_PER_TOKEN]
+            finish_reason = "length"
+        prompt_tokens = sum(count_tokens(message["content"]) for message in body["messages"])
+        completion_tokens = count_tokens(text)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        stats.requests += 1
+        stats.completion_tokens += completion_tokens
+
+        if body.get("stream"):
+            stats.streams += 1
+            chunk_size = TOKENS_PER_CHUNK * CHARS_PER_TOKEN
+
+            def event(delta, finish_reason=None):
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }) + "\n\n"
+
+            async def events():
+                await asyncio.sleep(latency)
+                yield event({"role": "assistant", "content": ""})
+                for start in range(0, len(text), chunk_size):
+                    await asyncio.sleep(TOKENS_PER_CHUNK / tokens_per_second)
+                    yield event({"content": text[start:start + chunk_size]})
+                yield event({}, finish_reason)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency + completion_tokens / tokens_per_second)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": finish_reason,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    app = Starlette(routes=[Route("/v1/chat/completions", chat_completions, methods=["POST"])])
+    app.state.stats = stats
+    return app
+
+
+def client(app: Starlette):
+    """An ``AsyncOpenAI`` client whose requests are served in-process by ``app``."""
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        api_key="mock",
+        base_url="http://mock-openai/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://mock-openai/v1"),
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.tokens_per_second), host=args.host, port=args.port)
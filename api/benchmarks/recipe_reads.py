@@ -0,0 +1,134 @@
+"""Bulk recipe read throughput: str-encoded JSON fields vs native JSON columns.
+
+Writes the same recipes to two SQLite files and times loading all of them
+through the ORM and reading their list fields ``--accesses`` times each, as
+a filter or serializer does:
+
+* ``str``    - the old layout: list fields stored as a JSON string inside a
+               JSON column, decoded again by ``*_list`` properties on every access
+* ``native`` - ``models.Recipe``: lists decoded once when the row is loaded
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.recipe_reads --recipes 5000 --accesses 3
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, Integer, MetaData, String, Table, create_engine, select
+from sqlalchemy.orm import Session, registry
+from sqlmodel import SQLModel
+
+from benchmarks.fakes import sample_meal
+from models import Recipe
+
+LIST_FIELDS = ('tags', 'ingredients', 'instructions')
+
+str_metadata = MetaData()
+str_recipe_table = Table(
+    'recipe', str_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String), Column('image', String), Column('prep_time', String),
+    Column('servings', Integer), Column('difficulty', String), Column('ayurvedic', String),
+    Column('tags', JSON), Column('ingredients', JSON), Column('instructions', JSON),
+    Column('calories', Integer), Column('protein', Integer), Column('carbs', Integer), Column('fat', Integer),
+    Column('created_at', DateTime), Column('user_id', Integer),
+)
+
+
+class StrRecipe:
+    """The recipe model before native JSON columns."""
+
+    def __init__(self, **data):
+        for field in LIST_FIELDS:
+            data[field] = json.dumps(data[field])
+        self.__dict__.update(data)
+
+    @property
+    def tags_list(self):
+        return json.loads(self.tags)
+
+    @property
+    def ingredients_list(self):
+        return json.loads(self.ingredients)
+
+    @property
+    def instructions_list(self):
+        return json.loads(self.instructions)
+
+
+registry().map_imperatively(StrRecipe, str_recipe_table)
+
+
+def recipe_data(i: int) -> dict:
+    meal = sample_meal(f'Recipe {i}')
+    return {
+        'name': meal['recipe'], 'image': meal['image'], 'prep_time': meal['prepTime'], 'servings': 2,
+        'difficulty': 'easy', 'ayurvedic': meal['ayurvedic'], 'tags': ['dinner', 'vegetarian', 'indian'],
+        'ingredients': meal['ingredients'], 'instructions': meal['instructions'],
+        'calories': meal['calories'], 'protein': meal['protein'], 'carbs': 50, 'fat': 15,
+        'created_at': datetime.utcnow(),
+    }
+
+
+def read_str(engine, accesses: int) -> int:
+    with Session(engine) as session:
+        recipes = session.scalars(select(StrRecipe)).all()
+        for recipe in recipes:
+            for _ in range(accesses):
+                recipe.tags_list, recipe.ingredients_list, recipe.instructions_list
+        return len(recipes)
+
+
+def read_native(engine, accesses: int) -> int:
+    with Session(engine) as session:
+        recipes = session.scalars(select(Recipe)).all()
+        for recipe in recipes:
+            for _ in range(accesses):
+                recipe.tags, recipe.ingredients, recipe.instructions
+        return len(recipes)
+
+
+def measure(read, engine, accesses: int, runs: int) -> float:
+    """Median recipes per second."""
+    rates = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        count = read(engine, accesses)
+        rates.append(count / (time.perf_counter() - start))
+    return statistics.median(rates)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        str_engine = create_engine(f'sqlite:///{os.path.join(directory, "str.db")}')
+        native_engine = create_engine(f'sqlite:///{os.path.join(directory, "native.db")}')
+        str_metadata.create_all(str_engine)
+        SQLModel.metadata.create_all(native_engine, tables=[Recipe.__table__])
+        with Session(str_engine) as session:
+            session.add_all(StrRecipe(**recipe_data(i)) for i in range(args.recipes))
+            session.commit()
+        with Session(native_engine) as session:
+            session.add_all(Recipe(**recipe_data(i)) for i in range(args.recipes))
+            session.commit()
+
+        print(f'recipes={args.recipes} accesses={args.accesses} runs={args.runs}')
+        str_rate = measure(read_str, str_engine, args.accesses, args.runs)
+        native_rate = measure(read_native, native_engine, args.accesses, args.runs)
+        print(f'{"str":<8} {str_rate:>10.0f} recipes/s')
+        print(f'{"native":<8} {native_rate:>10.0f} recipes/s  ({native_rate / str_rate:.2f}x)')
+        str_engine.dispose()
+        native_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--accesses', type=int, default=3, help='reads of each list field per recipe')
+    parser.add_argument('--runs', type=int, default=5)
+    main(parser.parse_args())
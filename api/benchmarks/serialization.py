@@ -0,0 +1,61 @@
+"""Serialization and wire-size micro-benchmark for the weekly meal plan.
+
+Compares FastAPI's default path (``jsonable_encoder`` + ``json.dumps``, as
+``JSONResponse`` does) with orjson, for the full plan and the ``summary``
+projection, and reports the gzip/brotli compressed sizes.
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.serialization --ingredients 10 --steps 8
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.fakes import sample_meal_plan
+from compression import brotli, compress
+from meal_plan_stream import summarize_meal_plan
+
+
+def default_dumps(data) -> bytes:
+    return json.dumps(
+        jsonable_encoder(data), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def fast_dumps(data) -> bytes:
+    return orjson.dumps(data, default=jsonable_encoder)
+
+
+def time_per_call(func, data, number: int) -> float:
+    return min(timeit.repeat(lambda: func(data), number=number, repeat=5)) / number
+
+
+def main(args):
+    plan = sample_meal_plan(args.ingredients, args.steps)
+    documents = {
+        'full': {'plan': plan, 'updatedAt': datetime.utcnow()},
+        'summary': summarize_meal_plan({'plan': plan, 'updatedAt': datetime.utcnow()}),
+    }
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+
+    print(f"{'view':<8} {'serializer':<18} {'time/call':>11} {'raw bytes':>10} "
+          + ' '.join(f'{e:>8}' for e in encodings))
+    for view, document in documents.items():
+        for name, func in (('jsonable+json', default_dumps), ('orjson', fast_dumps)):
+            body = func(document)
+            seconds = time_per_call(func, document, args.number)
+            sizes = ' '.join(f'{len(compress(body, e)):>8}' for e in encodings)
+            print(f"{view:<8} {name:<18} {seconds * 1e6:>9.1f}us {len(body):>10} {sizes}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ingredients', type=int, default=8, help='ingredients per meal')
+    parser.add_argument('--steps', type=int, default=6, help='instruction steps per meal')
+    parser.add_argument('--number', type=int, default=200, help='calls per timing run')
+    main(parser.parse_args())
@@ -0,0 +1,68 @@
+"""Shopping list read latency as the list grows: the whole list vs one page.
+
+Fills a user's list with ``--sizes`` items through ``storage`` and times
+``GET /api/shopping-list`` for the whole list and for the first page of
+``--limit`` unchecked items. The response cache is cleared before each
+read, so every request reaches the backend.
+
+Usage (from ``api/``)::
+
+    python -m benchmarks.shopping_list_pages --sizes 100 1000 5000 --storage sql
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeAsyncFirestore
+from benchmarks.harness import BENCH_USER, load_app
+
+
+async def timed_get(client: httpx.AsyncClient, params, runs: int) -> float:
+    """Median latency in milliseconds."""
+    from response_cache import response_cache
+
+    samples = []
+    for _ in range(runs):
+        response_cache.clear()
+        start = time.perf_counter()
+        response = await client.get('/api/shopping-list', params=params)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+async def run(args):
+    app = load_app(FakeAsyncFirestore(latency=args.latency))
+    from storage import storage
+
+    print(f'storage={args.storage} limit={args.limit} runs={args.runs}')
+    print(f'{"items":>7} {"whole list":>12} {"first page":>12}')
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        for size in args.sizes:
+            await storage.clear_shopping_list(BENCH_USER)
+            await storage.add_shopping_items(BENCH_USER, [
+                {'name': f'Item {i}', 'quantity': i, 'category': 'Produce', 'checked': i % 4 == 0}
+                for i in range(size)
+            ])
+            whole = await timed_get(client, {}, args.runs)
+            page = await timed_get(client, {'limit': args.limit, 'unchecked': 'true'}, args.runs)
+            print(f'{size:>7} {whole:>10.1f}ms {page:>10.1f}ms')
+
+
+def main(args):
+    os.environ['STORAGE_BACKEND'] = args.storage
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='FakeAsyncFirestore round trip latency (s)')
+    parser.add_argument('--storage', choices=['firestore', 'sql'], default='firestore')
+    main(parser.parse_args())
@@ -1,5 +1,8 @@
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from typing import AsyncGenerator, Generator, Optional
 import os
 
 # Database configuration
@@ -13,19 +16,31 @@ INSTANCE_UNIX_SOCKET = os.getenv("DB_HOST", "")
 
 if INSTANCE_UNIX_SOCKET:
     DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@/{DB_NAME}?host={DB_HOST}"
+    ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@/{DB_NAME}?host={DB_HOST}"
 else:
     # Local development fallback
     DATABASE_URL = "sqlite:///./vital_bites.db"
+    ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./vital_bites.db"
+# Explicit URLs (another host, a test database) take precedence
+DATABASE_URL = os.getenv("DATABASE_URL", DATABASE_URL)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", ASYNC_DATABASE_URL)
 
-# Create engine with connection pooling
+# Connection pool per worker process; with gunicorn the database sees up to
+# workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Sync engine for scripts and the create_db_and_tables helper
 engine = create_engine(
     DATABASE_URL,
-    pool_size=5,
-    max_overflow=2,
-    pool_timeout=30,
-    pool_recycle=1800,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-    echo=True  # Enable SQL query logging
+    echo=os.getenv("SQL_ECHO", "").lower() in ("1", "true")  # SQL query logging, off by default
 )
 
 def create_db_and_tables():
@@ -47,4 +62,61 @@ def get_session() -> Generator[Session, None, None]:
             session.rollback()
             raise
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+
+# Async engine for the request path: asyncpg on Cloud SQL, aiosqlite locally.
+# Its pool is bound to the event loop, so each worker creates it in the app
+# lifespan (init_async_engine) and disposes of it on shutdown.
+async_engine: Optional[AsyncEngine] = None
+async_session_factory: Optional[async_sessionmaker] = None
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets reads proceed during a write and commits skip most fsyncs
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def init_async_engine() -> AsyncEngine:
+    global async_engine, async_session_factory
+    if async_engine is None:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            echo=os.getenv("SQL_ECHO", "").lower() in ("1", "true")
+        )
+        if ASYNC_DATABASE_URL.startswith("sqlite"):
+            event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+        async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+    return async_engine
+
+async def close_async_engine():
+    global async_engine, async_session_factory
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+        async_session_factory = None
+
+def async_session() -> AsyncSession:
+    """A new session on the async engine; use as ``async with async_session() as session``."""
+    # Outside the app lifespan (scripts, benchmarks) the engine is created on first use
+    init_async_engine()
+    return async_session_factory()
+
+async def create_db_and_tables_async(*tables):
+    """Create ``tables`` (every table when none are given) on the async engine."""
+    async with init_async_engine().begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all, tables=[table.__table__ for table in tables] or None)
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Get an async database session"""
+    async with async_session() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
@@ -1,82 +1,271 @@
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import base64
+import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
-# Initialize Firebase Admin
-cred = credentials.Certificate(os.getenv('GOOGLE_APPLICATION_CREDENTIALS', 'service-account.json'))
-firebase_admin.initialize_app(cred)
+from metrics import instrument
+from response_cache import response_cache
 
-db = firestore.client()
+# Async client: every call below is awaited so a Firestore round trip never
+# blocks the event loop. Created per worker process by init_firebase.
+db = None
+_init_lock = threading.Lock()
 
-class FirestoreDB:
-    @staticmethod
-    def user_ref(user_id: str):
-        return db.collection('users').document(user_id)
+def init_firebase():
+    """Initialize Firebase Admin and the Firestore client; called once per worker from the app lifespan.
+
+    The Firestore SDK is imported here rather than at module level; it is one
+    of the slowest imports and the lifespan runs this off the startup path.
+    """
+    global db
+    with _init_lock:
+        if db is not None:
+            return
+        from firebase_admin import firestore_async
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(os.getenv('GOOGLE_APPLICATION_CREDENTIALS', 'service-account.json'))
+            firebase_admin.initialize_app(cred)
+        db = firestore_async.client()
+
+def _field_filter(field: str, op: str, value):
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    return FieldFilter(field, op, value)
+
+async def _collect(query) -> List:
+    return [doc async for doc in query.stream()]
+
+async def get_db():
+    if db is None:
+        # Outside the app lifespan (scripts, benchmarks) initialize on first use;
+        # the SDK import and credential load block, so keep them off the event loop
+        await run_in_threadpool(init_firebase)
+    return db
+
+async def user_ref(user_id: str):
+    return (await get_db()).collection('users').document(user_id)
+
+# Firestore rejects a write batch with more than 500 operations
+BATCH_LIMIT = 500
 
+# Deleted shopping items leave a tombstone for delta sync clients. The
+# shoppingListTombstones TTL policy on expireAt removes it after this long,
+# so a client that last synced earlier has to fetch everything again.
+TOMBSTONE_TTL = timedelta(days=int(os.getenv("SYNC_TOMBSTONE_TTL_DAYS", "30")))
+
+def tombstone(deleted_at: datetime) -> Dict:
+    return {'deletedAt': deleted_at, 'expireAt': deleted_at + TOMBSTONE_TTL}
+
+def _chunks(items: List, size: int = BATCH_LIMIT):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _naive(value: datetime) -> datetime:
+    # Firestore returns timestamps as aware UTC datetimes; they are written naive
+    return value.replace(tzinfo=None) if value.tzinfo is not None else value
+
+def encode_cursor(created_at: datetime, item_id: str) -> str:
+    """Opaque cursor for the position after the item ``(created_at, item_id)``."""
+    raw = json.dumps([created_at.isoformat(), item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), str(item_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def paginate(items: List[Dict], limit: int, fields: Optional[List[str]]) -> Tuple[List[Dict], Optional[str]]:
+    """Trim ``limit + 1`` fetched items to a page and the cursor of the next one."""
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(_naive(items[-1]['createdAt']), items[-1]['id'])
+    if fields is not None:
+        items = [{key: value for key, value in item.items() if key in fields or key == 'id'} for item in items]
+    return items, next_cursor
+
+@instrument('db')
+class FirestoreDB:
     @staticmethod
     async def get_user(user_id: str) -> Optional[Dict]:
-        doc = FirestoreDB.user_ref(user_id).get()
+        doc = await (await user_ref(user_id)).get()
         return doc.to_dict() if doc.exists else None
 
     @staticmethod
     async def create_user(user_id: str, user_data: Dict):
         user_data['createdAt'] = datetime.utcnow()
-        FirestoreDB.user_ref(user_id).set(user_data)
+        await (await user_ref(user_id)).set(user_data)
+        response_cache.invalidate(user_id, 'user')
 
     @staticmethod
     async def update_user(user_id: str, user_data: Dict):
-        FirestoreDB.user_ref(user_id).update(user_data)
+        await (await user_ref(user_id)).update(user_data)
+        response_cache.invalidate(user_id, 'user')
 
     @staticmethod
     async def get_user_preferences(user_id: str) -> Optional[Dict]:
-        doc = FirestoreDB.user_ref(user_id).collection('preferences').document('settings').get()
+        doc = await (await user_ref(user_id)).collection('preferences').document('settings').get()
         return doc.to_dict() if doc.exists else None
 
     @staticmethod
     async def update_user_preferences(user_id: str, preferences: Dict):
-        FirestoreDB.user_ref(user_id).collection('preferences').document('settings').set(
-            preferences, merge=True
+        await (await user_ref(user_id)).collection('preferences').document('settings').set(
+            preferences | {'updatedAt': datetime.utcnow()}, merge=True
         )
+        response_cache.invalidate(user_id, 'preferences')
 
     @staticmethod
     async def get_meal_plan(user_id: str) -> Optional[Dict]:
-        doc = FirestoreDB.user_ref(user_id).collection('mealPlans').document('current').get()
+        doc = await (await user_ref(user_id)).collection('mealPlans').document('current').get()
         return doc.to_dict() if doc.exists else None
 
     @staticmethod
     async def save_meal_plan(user_id: str, meal_plan: Dict):
-        FirestoreDB.user_ref(user_id).collection('mealPlans').document('current').set(
+        await (await user_ref(user_id)).collection('mealPlans').document('current').set(
             {
                 'plan': meal_plan,
                 'updatedAt': datetime.utcnow()
             }
         )
+        response_cache.invalidate(user_id, 'mealPlan', 'mealPlanSummary')
 
     @staticmethod
     async def get_shopping_list(user_id: str) -> List[Dict]:
-        docs = FirestoreDB.user_ref(user_id).collection('shoppingList').stream()
-        return [doc.to_dict() | {'id': doc.id} for doc in docs]
+        docs = (await user_ref(user_id)).collection('shoppingList').stream()
+        return [doc.to_dict() | {'id': doc.id} async for doc in docs]
+
+    @staticmethod
+    async def list_shopping_items(
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        checked: Optional[bool] = None,
+        category: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """One page of items in ``createdAt`` order, and the cursor of the next page (None on the last).
+
+        The equality filters combined with the ordering are served by the
+        ``shoppingList`` composite indexes in ``firestore.indexes.json``.
+        """
+        query = (await user_ref(user_id)).collection('shoppingList')
+        if checked is not None:
+            query = query.where(filter=_field_filter('checked', '==', checked))
+        if category is not None:
+            query = query.where(filter=_field_filter('category', '==', category))
+        query = query.order_by('createdAt').order_by('__name__')
+        if cursor is not None:
+            query = query.start_after(list(decode_cursor(cursor)))
+        if fields is not None:
+            # createdAt is needed for the next cursor
+            query = query.select(sorted(set(fields) | {'createdAt'}))
+        docs = query.limit(limit + 1).stream()
+        return paginate([doc.to_dict() | {'id': doc.id} async for doc in docs], limit, fields)
 
     @staticmethod
     async def add_shopping_item(user_id: str, item: Dict) -> str:
-        doc_ref = FirestoreDB.user_ref(user_id).collection('shoppingList').document()
-        doc_ref.set(item | {'createdAt': datetime.utcnow()})
+        doc_ref = (await user_ref(user_id)).collection('shoppingList').document()
+        now = datetime.utcnow()
+        await doc_ref.set(item | {'createdAt': now, 'updatedAt': now})
+        response_cache.invalidate(user_id, 'shoppingList')
         return doc_ref.id
 
     @staticmethod
     async def update_shopping_item(user_id: str, item_id: str, item: Dict):
-        FirestoreDB.user_ref(user_id).collection('shoppingList').document(item_id).update(
+        await (await user_ref(user_id)).collection('shoppingList').document(item_id).update(
             item | {'updatedAt': datetime.utcnow()}
         )
+        response_cache.invalidate(user_id, 'shoppingList')
 
     @staticmethod
     async def delete_shopping_item(user_id: str, item_id: str):
-        FirestoreDB.user_ref(user_id).collection('shoppingList').document(item_id).delete()
+        await FirestoreDB.delete_shopping_items(user_id, [item_id])
+
+    @staticmethod
+    async def add_shopping_items(user_id: str, items: List[Dict]) -> List[str]:
+        collection = (await user_ref(user_id)).collection('shoppingList')
+        now = datetime.utcnow()
+        client = await get_db()
+        ids = []
+        for chunk in _chunks(items):
+            batch = client.batch()
+            for item in chunk:
+                doc_ref = collection.document()
+                batch.set(doc_ref, item | {'createdAt': now, 'updatedAt': now})
+                ids.append(doc_ref.id)
+            await batch.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+        return ids
+
+    @staticmethod
+    async def update_shopping_items(user_id: str, items: List[Dict]):
+        """Apply partial updates; each item carries its document ``id``."""
+        collection = (await user_ref(user_id)).collection('shoppingList')
+        now = datetime.utcnow()
+        client = await get_db()
+        for chunk in _chunks(items):
+            batch = client.batch()
+            for item in chunk:
+                fields = {key: value for key, value in item.items() if key != 'id'}
+                batch.update(collection.document(item['id']), fields | {'updatedAt': now})
+            await batch.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+
+    @staticmethod
+    async def delete_shopping_items(user_id: str, item_ids: List[str]):
+        """Delete the items and record their tombstones in the same batches."""
+        await FirestoreDB.write_shopping_items(user_id, {}, item_ids)
+
+    @staticmethod
+    async def get_shopping_items_by_source(user_id: str, source: str) -> Dict[str, Dict]:
+        docs = (await user_ref(user_id)).collection('shoppingList').where(
+            filter=_field_filter('source', '==', source)
+        ).stream()
+        return {doc.id: doc.to_dict() async for doc in docs}
+
+    @staticmethod
+    async def write_shopping_items(user_id: str, items: Dict[str, Dict], deleted_ids: List[str]):
+        """Replace the documents in ``items`` (keyed by id) and delete ``deleted_ids``, batched."""
+        ref = await user_ref(user_id)
+        collection = ref.collection('shoppingList')
+        tombstones = ref.collection('shoppingListTombstones')
+        deleted = tombstone(datetime.utcnow())
+        writes = [(item_id, item) for item_id, item in items.items()]
+        writes += [(item_id, None) for item_id in deleted_ids]
+        client = await get_db()
+        # A delete is two operations: the document and its tombstone
+        for chunk in _chunks(writes, BATCH_LIMIT // 2):
+            batch = client.batch()
+            for item_id, item in chunk:
+                if item is None:
+                    batch.delete(collection.document(item_id))
+                    batch.set(tombstones.document(item_id), deleted)
+                else:
+                    batch.set(collection.document(item_id), item)
+            await batch.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
 
     @staticmethod
     async def clear_shopping_list(user_id: str):
-        docs = FirestoreDB.user_ref(user_id).collection('shoppingList').stream()
-        for doc in docs:
-            doc.reference.delete()
\ No newline at end of file
+        collection = (await user_ref(user_id)).collection('shoppingList')
+        # list_documents returns references only, without reading the item fields
+        item_ids = [doc_ref.id async for doc_ref in collection.list_documents()]
+        await FirestoreDB.delete_shopping_items(user_id, item_ids)
+
+    @staticmethod
+    async def get_shopping_changes(user_id: str, since: datetime) -> Tuple[List[Dict], List[str]]:
+        """Items written after ``since`` and the ids of items deleted after it."""
+        ref = await user_ref(user_id)
+        changed, deleted = await asyncio.gather(
+            _collect(ref.collection('shoppingList').where(filter=_field_filter('updatedAt', '>', since))),
+            _collect(ref.collection('shoppingListTombstones').where(filter=_field_filter('deletedAt', '>', since))),
+        )
+        return [doc.to_dict() | {'id': doc.id} for doc in changed], [doc.id for doc in deleted]
@@ -0,0 +1,60 @@
+"""Production server: gunicorn managing uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Every worker is a separate process with its own event loop, Firebase app,
+Firestore and OpenAI clients (created in the app lifespan, after the fork)
+and its own in-memory caches. To share that state between the workers on
+a host, set ``RATE_LIMIT_BACKEND`` and ``JOB_STORE_BACKEND`` to ``sqlite``,
+and ``MEAL_PLAN_CACHE_BACKEND`` to ``sqlite`` or ``firestore``.
+With the default in-memory rate limiter, ``LLM_MAX_CONCURRENT_REQUESTS`` is
+a per-worker cap, so the host admits workers times that many generations.
+
+With the default ``memory`` job store a job only exists in the worker that
+accepted it, and a status poll that reaches another worker gets a 404. So
+unless ``JOB_STORE_BACKEND`` is shared, the default is a single worker, and
+a larger ``WEB_CONCURRENCY`` logs a warning at startup.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+SHARED_JOB_STORE = os.getenv("JOB_STORE_BACKEND", "memory") != "memory"
+
+# The workers are async, so one per core is enough; WEB_CONCURRENCY overrides
+# (on Cloud Run match it to the CPUs allocated to the container)
+default_workers = min(multiprocessing.cpu_count(), int(os.getenv("MAX_WORKERS", "8"))) if SHARED_JOB_STORE else 1
+workers = int(os.getenv("WEB_CONCURRENCY", str(default_workers)))
+# The workers inherit it: response_cache.py keeps no bodies when there are several
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# A uvicorn worker heartbeats from its event loop, so this only trips when
+# the loop is blocked, not on a long generation
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+# After SIGTERM, workers stop accepting connections and get this long to
+# finish in-flight requests (a synchronous generation can take a minute)
+# and drain background jobs before they are killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "90"))
+keepalive = int(os.getenv("KEEPALIVE_SECONDS", "5"))
+
+# Recycle workers now and then to bound memory growth; 0 disables
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+# Not preloading keeps client creation out of the master process, where
+# gRPC and HTTP connection pools would not survive the fork
+preload_app = False
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    if workers > 1 and not SHARED_JOB_STORE:
+        server.log.warning(
+            "%d workers with JOB_STORE_BACKEND=memory: meal plan job polls that reach another "
+            "worker than the submit return 404; set JOB_STORE_BACKEND=sqlite", workers
+        )
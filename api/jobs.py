@@ -0,0 +1,391 @@
+"""Background meal-plan generation jobs.
+
+``POST /api/meal-plan/jobs`` enqueues a generation and returns at once; a
+fixed pool of asyncio workers runs the jobs with retries and writes the
+result through ``storage.save_meal_plan``. A job submitted while an
+identical one (same user, same cache key) is still queued or running is
+deduplicated onto the existing job. Job state lives in a ``JobStore``:
+in memory, or a SQLite file (``JOB_STORE_BACKEND=sqlite``) so queued jobs
+survive a restart.
+
+Every queued or running job is leased by the process that holds it in its
+queue (``WORKER_ID``: pid plus a boot id). The lease is renewed by a
+heartbeat while the process lives. A job is only taken over once its lease
+has expired, and the takeover is a conditional update, so with a store shared
+by several workers each abandoned job is claimed by exactly one of them.
+
+Finished and failed jobs, meal plan result included, are kept for
+``MEAL_PLAN_JOB_RETENTION_SECONDS`` after their last update so clients can
+poll them, then the heartbeat removes them; a later poll gets a 404.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from storage import storage
+from meal_plan_cache import cache_key, meal_plan_cache
+from models import UserPreferences
+from openai_service import get_meal_plan_generator
+from meal_planner import library_first
+from recipe_library import recipe_library
+from shopping_list import sync_shopping_list_from_plan
+from token_budget import track_usage
+
+logger = logging.getLogger(__name__)
+
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "memory")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "./meal_plan_jobs.db")
+MEAL_PLAN_JOB_WORKERS = int(os.getenv("MEAL_PLAN_JOB_WORKERS", "2"))
+MEAL_PLAN_JOB_MAX_ATTEMPTS = int(os.getenv("MEAL_PLAN_JOB_MAX_ATTEMPTS", "3"))
+MEAL_PLAN_JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("MEAL_PLAN_JOB_RETRY_BACKOFF_SECONDS", "2"))
+# How long shutdown waits for running jobs before cancelling them
+MEAL_PLAN_JOB_DRAIN_SECONDS = float(os.getenv("MEAL_PLAN_JOB_DRAIN_SECONDS", "60"))
+# A job whose owner has not renewed its lease for this long is taken over
+MEAL_PLAN_JOB_LEASE_SECONDS = float(os.getenv("MEAL_PLAN_JOB_LEASE_SECONDS", "60"))
+# How long a finished or failed job stays pollable before it is removed
+MEAL_PLAN_JOB_RETENTION_SECONDS = float(os.getenv("MEAL_PLAN_JOB_RETENTION_SECONDS", "3600"))
+
+# Identifies this process as the owner of its jobs; the boot id tells a
+# restarted process apart from an earlier one with the same pid
+WORKER_ID = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # id -> (owner, lease expiry as a unix time)
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    async def create(self, job: Dict[str, Any], owner: str, lease_expires: float):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            self._leases[job["id"]] = (owner, lease_expires)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    async def update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updatedAt=datetime.utcnow().isoformat())
+
+    async def find_active(self, dedup_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for job in self._jobs.values():
+                if job["dedupKey"] == dedup_key and job["status"] in ACTIVE_STATUSES:
+                    return dict(job)
+        return None
+
+    async def renew(self, owner: str, lease_expires: float):
+        with self._lock:
+            for job_id, (job_owner, _) in self._leases.items():
+                if job_owner == owner:
+                    self._leases[job_id] = (owner, lease_expires)
+
+    async def claim_expired(self, owner: str, lease_expires: float) -> List[str]:
+        now = time.time()
+        with self._lock:
+            claimed = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in ACTIVE_STATUSES and self._leases.get(job_id, ("", 0.0))[1] < now
+            ]
+            for job_id in claimed:
+                self._leases[job_id] = (owner, lease_expires)
+        return claimed
+
+    async def purge_finished(self, updated_before: str) -> int:
+        with self._lock:
+            finished = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in TERMINAL_STATUSES and job["updatedAt"] < updated_before
+            ]
+            for job_id in finished:
+                del self._jobs[job_id]
+                self._leases.pop(job_id, None)
+        return len(finished)
+
+
+class SQLiteJobStore:
+    """Jobs as JSON rows in a local SQLite file."""
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meal_plan_jobs "
+                "(id TEXT PRIMARY KEY, dedup_key TEXT NOT NULL, status TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS meal_plan_jobs_active ON meal_plan_jobs (dedup_key, status)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(meal_plan_jobs)")}
+            # Files created before leases; their jobs count as expired
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE meal_plan_jobs ADD COLUMN owner TEXT")
+            if "lease_expires" not in columns:
+                conn.execute("ALTER TABLE meal_plan_jobs ADD COLUMN lease_expires REAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _write(self, conn: sqlite3.Connection, job: Dict[str, Any]):
+        # An upsert rather than INSERT OR REPLACE, which would clear the lease columns
+        conn.execute(
+            "INSERT INTO meal_plan_jobs (id, dedup_key, status, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET dedup_key = excluded.dedup_key, status = excluded.status, "
+            "data = excluded.data",
+            (job["id"], job["dedupKey"], job["status"], json.dumps(job)),
+        )
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM meal_plan_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update(self, job_id: str, fields: Dict[str, Any]):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM meal_plan_jobs WHERE id = ?", (job_id,)).fetchone()
+            job = json.loads(row[0]) | fields | {"updatedAt": datetime.utcnow().isoformat()}
+            self._write(conn, job)
+
+    def _select(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT data FROM meal_plan_jobs WHERE {where}", params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _create(self, job: Dict[str, Any], owner: str, lease_expires: float):
+        with self._connect() as conn:
+            self._write(conn, job)
+            conn.execute(
+                "UPDATE meal_plan_jobs SET owner = ?, lease_expires = ? WHERE id = ?",
+                (owner, lease_expires, job["id"]),
+            )
+
+    def _renew(self, owner: str, lease_expires: float):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE meal_plan_jobs SET lease_expires = ? WHERE owner = ? AND status IN (?, ?)",
+                (lease_expires, owner, *ACTIVE_STATUSES),
+            )
+
+    def _claim_expired(self, owner: str, lease_expires: float) -> List[str]:
+        now = time.time()
+        claimed = []
+        with self._connect() as conn:
+            candidates = conn.execute(
+                "SELECT id FROM meal_plan_jobs WHERE status IN (?, ?) AND COALESCE(lease_expires, 0) < ?",
+                (*ACTIVE_STATUSES, now),
+            ).fetchall()
+            for (job_id,) in candidates:
+                # Another worker may have claimed it since the select; only one update matches
+                cursor = conn.execute(
+                    "UPDATE meal_plan_jobs SET owner = ?, lease_expires = ? "
+                    "WHERE id = ? AND status IN (?, ?) AND COALESCE(lease_expires, 0) < ?",
+                    (owner, lease_expires, job_id, *ACTIVE_STATUSES, now),
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(job_id)
+        return claimed
+
+    def _purge_finished(self, updated_before: str) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM meal_plan_jobs WHERE status IN (?, ?) AND json_extract(data, '$.updatedAt') < ?",
+                (*TERMINAL_STATUSES, updated_before),
+            )
+        return cursor.rowcount
+
+    async def create(self, job: Dict[str, Any], owner: str, lease_expires: float):
+        await run_in_threadpool(self._create, job, owner, lease_expires)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self._get, job_id)
+
+    async def update(self, job_id: str, **fields):
+        await run_in_threadpool(self._update, job_id, fields)
+
+    async def find_active(self, dedup_key: str) -> Optional[Dict[str, Any]]:
+        jobs = await run_in_threadpool(
+            self._select, "dedup_key = ? AND status IN (?, ?)", (dedup_key, *ACTIVE_STATUSES)
+        )
+        return jobs[0] if jobs else None
+
+    async def renew(self, owner: str, lease_expires: float):
+        await run_in_threadpool(self._renew, owner, lease_expires)
+
+    async def claim_expired(self, owner: str, lease_expires: float) -> List[str]:
+        return await run_in_threadpool(self._claim_expired, owner, lease_expires)
+
+    async def purge_finished(self, updated_before: str) -> int:
+        return await run_in_threadpool(self._purge_finished, updated_before)
+
+
+JOB_STORES = {
+    "memory": MemoryJobStore,
+    "sqlite": SQLiteJobStore,
+}
+
+
+class MealPlanJobQueue:
+    def __init__(
+        self,
+        store,
+        workers: int = MEAL_PLAN_JOB_WORKERS,
+        max_attempts: int = MEAL_PLAN_JOB_MAX_ATTEMPTS,
+        retry_backoff: float = MEAL_PLAN_JOB_RETRY_BACKOFF_SECONDS,
+        lease: float = MEAL_PLAN_JOB_LEASE_SECONDS,
+        retention: float = MEAL_PLAN_JOB_RETENTION_SECONDS,
+    ):
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease = lease
+        self.retention = retention
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Workers currently running a job, as opposed to waiting on the queue
+        self._busy: Set[asyncio.Task] = set()
+        self._draining = False
+        self._submit_lock = asyncio.Lock()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._draining = False
+        # Jobs left queued or running by a process that is gone are picked up again
+        await self._claim_expired()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _claim_expired(self):
+        for job_id in await self.store.claim_expired(WORKER_ID, time.time() + self.lease):
+            logger.info("Taking over meal plan job %s after its lease expired", job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _heartbeat(self):
+        """Renew the leases of this process's jobs, take over expired ones and drop old finished ones."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.store.renew(WORKER_ID, time.time() + self.lease)
+                if not self._draining:
+                    await self._claim_expired()
+                    cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+                    await self.store.purge_finished(cutoff.isoformat())
+            except Exception as e:
+                logger.exception("Meal plan job heartbeat failed: %s", e)
+
+    async def stop(self, drain_timeout: float = MEAL_PLAN_JOB_DRAIN_SECONDS):
+        """Stop taking jobs and give the running ones ``drain_timeout`` seconds to finish.
+
+        Jobs cancelled after that stay ``running`` in the store. Their leases,
+        and those of jobs still queued, are released, so with the SQLite store
+        another worker takes them over at its next heartbeat.
+        """
+        self._draining = True
+        busy = set(self._busy)
+        for task in self._tasks:
+            if task not in busy:
+                task.cancel()
+        if busy:
+            logger.info("Waiting up to %ss for %d meal plan job(s) to finish", drain_timeout, len(busy))
+            _, pending = await asyncio.wait(busy, timeout=drain_timeout)
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Renewed through the drain; now the jobs left are free for other workers
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        await self.store.renew(WORKER_ID, 0.0)
+
+    async def submit(
+        self,
+        user_id: str,
+        preferences: UserPreferences,
+        force_refresh: bool = False,
+    ) -> Dict[str, Any]:
+        dedup_key = f"{user_id}:{cache_key(preferences)}:{int(force_refresh)}"
+        async with self._submit_lock:
+            existing = await self.store.find_active(dedup_key)
+            if existing:
+                return existing
+            now = datetime.utcnow().isoformat()
+            job = {
+                "id": uuid.uuid4().hex,
+                "userId": user_id,
+                "dedupKey": dedup_key,
+                "status": QUEUED,
+                "attempts": 0,
+                "forceRefresh": force_refresh,
+                "preferences": preferences.model_dump(),
+                "error": None,
+                "result": None,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            await self.store.create(job, WORKER_ID, time.time() + self.lease)
+        self._queue.put_nowait(job["id"])
+        return job
+
+    async def _worker(self):
+        task = asyncio.current_task()
+        while not self._draining:
+            job_id = await self._queue.get()
+            self._busy.add(task)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.exception("Meal plan job %s crashed: %s", job_id, e)
+            finally:
+                self._busy.discard(task)
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self.store.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return
+        preferences = UserPreferences(**job["preferences"])
+        for attempt in range(job["attempts"] + 1, self.max_attempts + 1):
+            await self.store.update(job_id, status=RUNNING, attempts=attempt)
+            try:
+                with track_usage() as usage:
+                    meal_plan = await meal_plan_cache.get_or_generate(
+                        preferences, library_first(get_meal_plan_generator()), force_refresh=job["forceRefresh"]
+                    )
+                plan = json.loads(meal_plan)
+                await storage.save_meal_plan(job["userId"], plan)
+                await sync_shopping_list_from_plan(job["userId"], plan)
+                await recipe_library.harvest(plan, preferences)
+                await self.store.update(job_id, status=SUCCEEDED, result=plan, usage=usage.to_dict(), error=None)
+                return
+            except Exception as e:
+                logger.warning("Meal plan job %s attempt %d failed: %s", job_id, attempt, e)
+                await self.store.update(job_id, error=str(e))
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+        await self.store.update(job_id, status=FAILED)
+
+
+job_queue = MealPlanJobQueue(JOB_STORES[JOB_STORE_BACKEND]())
@@ -1,23 +1,119 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from pydantic import ValidationError
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, Any
-import uvicorn
+from typing import Dict, Any, List, Literal, Optional
+import asyncio
 import json
-import firebase_admin
+import logging
+import os
 from firebase_admin import auth as firebase_auth
 
-from firestore_db import FirestoreDB
-from models import UserPreferences, Recipe, RecipeCreate, UserCreate
+from database import close_async_engine, init_async_engine
+from storage import SHOPPING_LIST_MAX_PAGE_SIZE, SHOPPING_LIST_PAGE_SIZE, init_storage, storage
+from models import PlannedMeal, UserPreferences, Recipe, RecipeCreate, RecipeUpdate, UserCreate
 from auth import (
     create_access_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_current_user
+    get_current_user,
+    token_cache
 )
-from openai_service import generate_meal_plan
+from openai_service import (
+    close_openai_client,
+    get_meal_plan_generator,
+    init_openai_client,
+    openai_metrics,
+    plan_days,
+    repair_meal_plan,
+    stream_meal_plan
+)
+from meal_plan_cache import meal_plan_cache
+from meal_plan_stream import IncrementalPlanParser, iter_meals, ndjson_event, summarize_meal_plan
+from jobs import job_queue
+from shopping_list import sync_shopping_list_from_plan
+from sync import preferences_payload, sync_changes
+from recipe_library import DuplicateRecipeError, ReadOnlyRecipeError, recipe_library
+from meal_planner import library_first, meal_planner_stats, plan_from_library
+from response_cache import cached_response, response_cache
+from compression import CompressionMiddleware
+from rate_limit import AdmissionControlMiddleware, admission_stats
+from token_budget import TokenUsage, token_accounting, track_usage
+from metrics import TimingMiddleware, register_collector, render as render_metrics, span
+
+logger = logging.getLogger(__name__)
+
+def usage_headers(usage: TokenUsage) -> Dict[str, str]:
+    """Token accounting for one plan; all zero when it came from the cache."""
+    return {
+        "X-LLM-Completions": str(usage.completions),
+        "X-LLM-Prompt-Tokens": str(usage.prompt_tokens),
+        "X-LLM-Completion-Tokens": str(usage.completion_tokens),
+        "X-LLM-Seconds": f"{usage.seconds:.3f}",
+    }
+
+async def warm_up(app: FastAPI):
+    """Connect the storage backend, create the OpenAI client and load the recipe index off the startup path."""
+    try:
+        await init_storage()
+        await init_openai_client()
+    except Exception as e:
+        # Requests still initialize the clients on first use
+        logger.exception("Warm-up failed: %s", e)
+        return
+    try:
+        await recipe_library.ensure_loaded()
+    except Exception as e:
+        # The library is optional: plans are generated until it loads
+        logger.exception("Recipe library failed to load: %s", e)
+    app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process, after the fork, so each gets its own
+    # clients. They are created in the background: the worker starts serving
+    # (and /healthz answers) without waiting for the SDK imports.
+    app.state.ready = False
+    # The SQL connection pool belongs to this worker's event loop
+    init_async_engine()
+    warm_up_task = asyncio.create_task(warm_up(app))
+    await job_queue.start()
+    yield
+    # The server stops accepting connections and lets in-flight requests
+    # (including streamed generations) finish before this runs; background
+    # jobs get their own drain window
+    await job_queue.stop()
+    await warm_up_task
+    await close_openai_client()
+    await close_async_engine()
+
+app = FastAPI(title="Vital Bites API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Compress large responses (the weekly plan) with brotli or gzip
+app.add_middleware(CompressionMiddleware)
+
+register_collector("token_cache", token_cache.stats)
+register_collector("meal_plan_cache", meal_plan_cache.stats)
+register_collector("response_cache", response_cache.stats)
+register_collector("openai", openai_metrics.stats)
+register_collector("tokens", token_accounting.stats)
+register_collector("admission", admission_stats.stats)
+register_collector("recipe_library", recipe_library.stats)
+register_collector("meal_planner", meal_planner_stats.stats)
 
-app = FastAPI(title="Vital Bites API")
+@app.get("/healthz")
+async def healthz():
+    """Liveness and startup probe; answers before the dependency clients are ready."""
+    return {"status": "ok", "ready": app.state.ready}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Shed excess generation traffic with 429 before it reaches OpenAI
+app.add_middleware(AdmissionControlMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -28,18 +124,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last, so it is the outermost middleware: the recorded latency covers
+# every other middleware, and requests shed by admission control are counted
+app.add_middleware(TimingMiddleware)
+
 @app.post("/register")
 async def register_user(user: UserCreate):
     try:
         # Create user in Firebase Auth
-        user_record = firebase_auth.create_user(
-            email=user.email,
-            password=user.password,
-            display_name=user.name
-        )
+        with span("auth", "create_user"):
+            user_record = firebase_auth.create_user(
+                email=user.email,
+                password=user.password,
+                display_name=user.name
+            )
         
         # Create user document in Firestore
-        await FirestoreDB.create_user(user_record.uid, {
+        await storage.create_user(user_record.uid, {
             'email': user.email,
             'name': user.name
         })
@@ -59,10 +160,12 @@ async def register_user(user: UserCreate):
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
         # Verify the user with Firebase Auth
-        user = firebase_auth.get_user_by_email(form_data.username)
+        with span("auth", "get_user_by_email"):
+            user = firebase_auth.get_user_by_email(form_data.username)
         
         # Create custom token
-        custom_token = firebase_auth.create_custom_token(user.uid)
+        with span("auth", "create_custom_token"):
+            custom_token = firebase_auth.create_custom_token(user.uid)
         
         # Create access token for API
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -84,9 +187,11 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
 
 @app.get("/me")
-async def read_users_me(current_user: str = Depends(get_current_user)):
+async def read_users_me(request: Request, current_user: str = Depends(get_current_user)):
     try:
-        user_data = await FirestoreDB.get_user(current_user)
+        user_data = await cached_response(
+            request, current_user, 'user', lambda: storage.get_user(current_user)
+        )
         if not user_data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -102,26 +207,153 @@ async def read_users_me(current_user: str = Depends(get_current_user)):
 @app.post("/api/meal-plan/generate")
 async def generate_weekly_meal_plan(
     preferences: UserPreferences,
+    force_refresh: bool = False,
+    view: Literal["full", "summary"] = "full",
     current_user: str = Depends(get_current_user)
-) -> Dict[str, Any]:
+):
     try:
-        # Generate meal plan using OpenAI
-        meal_plan = await generate_meal_plan(preferences)
+        # Assemble the plan from the recipe library, or generate it using OpenAI,
+        # unless identical preferences were seen recently
+        with track_usage() as usage:
+            meal_plan = await meal_plan_cache.get_or_generate(
+                preferences, library_first(get_meal_plan_generator()), force_refresh=force_refresh
+            )
         
+        plan = json.loads(meal_plan)
+
         # Save to Firestore
-        await FirestoreDB.save_meal_plan(current_user, json.loads(meal_plan))
+        await storage.save_meal_plan(current_user, plan)
+        await sync_shopping_list_from_plan(current_user, plan)
+        await recipe_library.harvest(plan, preferences)
         
-        return json.loads(meal_plan)
+        return ORJSONResponse(
+            summarize_meal_plan(plan) if view == "summary" else plan,
+            headers=usage_headers(usage)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate meal plan: {str(e)}"
         )
 
+@app.post("/api/meal-plan/generate/stream")
+async def stream_weekly_meal_plan(
+    preferences: UserPreferences,
+    force_refresh: bool = False,
+    current_user: str = Depends(get_current_user)
+):
+    """Generate a meal plan as NDJSON: one ``meal`` event per completed meal, then ``done``.
+
+    Only valid meals of the planned days are streamed. When a day that was
+    already streamed is regenerated during repair, a ``replace_day`` event
+    carries all its meals and the client drops what it had for that day.
+    """
+    async def events():
+        usage = TokenUsage()
+        try:
+            cached = None if force_refresh else await meal_plan_cache.lookup(preferences)
+            if cached is not None:
+                plan = json.loads(cached)
+                for day, meal, data in iter_meals(plan):
+                    yield ndjson_event("meal", day=day, meal=meal, data=data)
+            else:
+                # Days whose meals have gone out in the stream
+                streamed = set()
+                with track_usage() as usage:
+                    plan = await plan_from_library(preferences)
+                    if plan is not None:
+                        pending = list(plan["weeklyPlan"])
+                    else:
+                        parser = IncrementalPlanParser()
+                        days = plan_days(preferences)
+                        async for chunk in stream_meal_plan(preferences):
+                            for day, meal, data in parser.feed(chunk):
+                                if day not in days:
+                                    continue
+                                try:
+                                    data = PlannedMeal.model_validate(data).model_dump()
+                                except ValidationError:
+                                    continue
+                                streamed.add(day)
+                                yield ndjson_event("meal", day=day, meal=meal, data=data)
+                        # Days cut off or invalid in the stream are regenerated one by one
+                        plan, pending = await repair_meal_plan(preferences, parser.buffer)
+                for day in pending:
+                    if day in streamed:
+                        yield ndjson_event("replace_day", day=day, meals=plan["weeklyPlan"][day])
+                        continue
+                    for meal, data in plan["weeklyPlan"][day].items():
+                        yield ndjson_event("meal", day=day, meal=meal, data=data)
+                await meal_plan_cache.store(preferences, json.dumps(plan))
+
+            await storage.save_meal_plan(current_user, plan)
+            await sync_shopping_list_from_plan(current_user, plan)
+            await recipe_library.harvest(plan, preferences)
+            yield ndjson_event("done", plan=plan, usage=usage.to_dict())
+        except Exception as e:
+            # Headers are already sent, so failures are reported in-band
+            yield ndjson_event("error", detail=f"Failed to generate meal plan: {str(e)}")
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/api/meal-plan/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_meal_plan_job(
+    preferences: UserPreferences,
+    force_refresh: bool = False,
+    current_user: str = Depends(get_current_user)
+):
+    try:
+        job = await job_queue.submit(current_user, preferences, force_refresh=force_refresh)
+        return {"jobId": job["id"], "status": job["status"]}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to submit meal plan job: {str(e)}"
+        )
+
+@app.get("/api/meal-plan/jobs/{job_id}")
+async def get_meal_plan_job(job_id: str, current_user: str = Depends(get_current_user)):
+    try:
+        job = await job_queue.store.get(job_id)
+        if not job or job["userId"] != current_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Job not found"
+            )
+        return {
+            "jobId": job["id"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "error": job["error"],
+            "result": job["result"],
+            "usage": job.get("usage"),
+            "createdAt": job["createdAt"],
+            "updatedAt": job["updatedAt"],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @app.get("/api/meal-plan")
-async def get_meal_plan(current_user: str = Depends(get_current_user)):
+async def get_meal_plan(
+    request: Request,
+    view: Literal["full", "summary"] = "full",
+    current_user: str = Depends(get_current_user)
+):
+    """The saved plan; ``view=summary`` leaves out the meal instructions."""
+    async def load():
+        meal_plan = await storage.get_meal_plan(current_user)
+        if meal_plan and view == "summary":
+            return summarize_meal_plan(meal_plan)
+        return meal_plan
+
     try:
-        meal_plan = await FirestoreDB.get_meal_plan(current_user)
+        resource = 'mealPlanSummary' if view == "summary" else 'mealPlan'
+        meal_plan = await cached_response(request, current_user, resource, load)
         if not meal_plan:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -137,9 +369,12 @@ async def get_meal_plan(current_user: str = Depends(get_current_user)):
         )
 
 @app.get("/api/preferences")
-async def get_preferences(current_user: str = Depends(get_current_user)):
+async def get_preferences(request: Request, current_user: str = Depends(get_current_user)):
     try:
-        preferences = await FirestoreDB.get_user_preferences(current_user)
+        async def load():
+            return preferences_payload(await storage.get_user_preferences(current_user))
+
+        preferences = await cached_response(request, current_user, 'preferences', load)
         if not preferences:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -160,7 +395,7 @@ async def update_preferences(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        await FirestoreDB.update_user_preferences(current_user, preferences)
+        await storage.update_user_preferences(current_user, preferences)
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(
@@ -169,10 +404,48 @@ async def update_preferences(
         )
 
 @app.get("/api/shopping-list")
-async def get_shopping_list(current_user: str = Depends(get_current_user)):
+async def get_shopping_list(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=SHOPPING_LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    unchecked: bool = False,
+    category: Optional[str] = None,
+    fields: Optional[List[str]] = Query(None),
+    current_user: str = Depends(get_current_user)
+):
+    """The whole list, or with any paging parameter one page in ``createdAt`` order.
+
+    The cursor of the next page is in ``X-Next-Cursor``, absent on the last page.
+    """
+    if limit is None and cursor is None and not unchecked and category is None and fields is None:
+        try:
+            items = await cached_response(
+                request, current_user, 'shoppingList', lambda: storage.get_shopping_list(current_user)
+            )
+            return items
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=str(e)
+            )
     try:
-        items = await FirestoreDB.get_shopping_list(current_user)
+        items, next_cursor = await storage.list_shopping_items(
+            current_user,
+            limit or SHOPPING_LIST_PAGE_SIZE,
+            cursor=cursor,
+            checked=False if unchecked else None,
+            category=category,
+            fields=fields,
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return items
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -185,7 +458,7 @@ async def add_shopping_item(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        item_id = await FirestoreDB.add_shopping_item(current_user, item)
+        item_id = await storage.add_shopping_item(current_user, item)
         return {"id": item_id}
     except Exception as e:
         raise HTTPException(
@@ -193,6 +466,75 @@ async def add_shopping_item(
             detail=str(e)
         )
 
+@app.post("/api/shopping-list/from-meal-plan")
+async def derive_shopping_list(
+    days: Optional[List[str]] = Query(None),
+    current_user: str = Depends(get_current_user)
+):
+    """Rebuild the meal-plan items of the shopping list, optionally for just ``days``."""
+    try:
+        meal_plan = await storage.get_meal_plan(current_user)
+        if not meal_plan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No meal plan found"
+            )
+        return await sync_shopping_list_from_plan(current_user, meal_plan['plan'], days=days)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.post("/api/shopping-list/bulk")
+async def add_shopping_items(
+    items: List[Dict[str, Any]],
+    current_user: str = Depends(get_current_user)
+):
+    try:
+        item_ids = await storage.add_shopping_items(current_user, items)
+        return {"ids": item_ids}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.patch("/api/shopping-list/bulk")
+async def update_shopping_items(
+    items: List[Dict[str, Any]],
+    current_user: str = Depends(get_current_user)
+):
+    if any(not item.get("id") for item in items):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Every item must include its id"
+        )
+    try:
+        await storage.update_shopping_items(current_user, items)
+        return {"status": "success"}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.post("/api/shopping-list/bulk-delete")
+async def delete_shopping_items(
+    item_ids: List[str],
+    current_user: str = Depends(get_current_user)
+):
+    try:
+        await storage.delete_shopping_items(current_user, item_ids)
+        return {"status": "success"}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @app.put("/api/shopping-list/{item_id}")
 async def update_shopping_item(
     item_id: str,
@@ -200,7 +542,7 @@ async def update_shopping_item(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        await FirestoreDB.update_shopping_item(current_user, item_id, item)
+        await storage.update_shopping_item(current_user, item_id, item)
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(
@@ -214,7 +556,7 @@ async def delete_shopping_item(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        await FirestoreDB.delete_shopping_item(current_user, item_id)
+        await storage.delete_shopping_item(current_user, item_id)
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(
@@ -225,7 +567,7 @@ async def delete_shopping_item(
 @app.delete("/api/shopping-list")
 async def clear_shopping_list(current_user: str = Depends(get_current_user)):
     try:
-        await FirestoreDB.clear_shopping_list(current_user)
+        await storage.clear_shopping_list(current_user)
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(
@@ -233,5 +575,151 @@ async def clear_shopping_list(current_user: str = Depends(get_current_user)):
             detail=str(e)
         )
 
+@app.get("/api/sync")
+async def sync(
+    since: Optional[datetime] = None,
+    current_user: str = Depends(get_current_user)
+):
+    """Shopping list and preference changes since the ``syncedAt`` of the previous sync."""
+    try:
+        return await sync_changes(current_user, since)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.get("/recipes/")
+async def list_recipes(
+    response: Response,
+    q: Optional[str] = None,
+    tags: List[str] = Query(default=[]),
+    dosha: List[str] = Query(default=[]),
+    restrictions: List[str] = Query(default=[]),
+    meal: Optional[Literal["breakfast", "lunch", "dinner"]] = None,
+    max_prep_minutes: Optional[int] = None,
+    min_calories: Optional[float] = None,
+    max_calories: Optional[float] = None,
+    min_protein: Optional[float] = None,
+    max_protein: Optional[float] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: str = Depends(get_current_user)
+):
+    """Recipes matching every filter (any of ``dosha``), one page at a time; the total is in ``X-Total-Count``."""
+    try:
+        total, recipes = await recipe_library.search(
+            offset=offset,
+            limit=limit,
+            text=q,
+            tags=tags + ([meal] if meal else []),
+            doshas=dosha,
+            restrictions=restrictions,
+            ranges={
+                "prep_minutes": (None, max_prep_minutes),
+                "calories": (min_calories, max_calories),
+                "protein": (min_protein, max_protein),
+            },
+        )
+        response.headers["X-Total-Count"] = str(total)
+        return recipes
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.get("/recipes/{recipe_id}")
+async def get_recipe(recipe_id: int, current_user: str = Depends(get_current_user)):
+    await recipe_library.ensure_loaded()
+    recipe = recipe_library.get(recipe_id)
+    if recipe is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recipe not found"
+        )
+    return recipe
+
+@app.post("/recipes/", status_code=status.HTTP_201_CREATED)
+async def create_recipe(recipe: RecipeCreate, current_user: str = Depends(get_current_user)):
+    try:
+        return await recipe_library.create(recipe.model_dump(), current_user)
+    except DuplicateRecipeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.put("/recipes/{recipe_id}")
+async def update_recipe(
+    recipe_id: int,
+    updates: RecipeUpdate,
+    current_user: str = Depends(get_current_user)
+):
+    try:
+        # Null for a required column would fail on commit, so it means "unchanged"
+        recipe = await recipe_library.update(
+            recipe_id, updates.model_dump(exclude_unset=True, exclude_none=True), current_user
+        )
+        if recipe is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Recipe not found"
+            )
+        return recipe
+    except HTTPException:
+        raise
+    except ReadOnlyRecipeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except DuplicateRecipeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.delete("/recipes/{recipe_id}")
+async def delete_recipe(recipe_id: int, current_user: str = Depends(get_current_user)):
+    try:
+        if not await recipe_library.delete(recipe_id, current_user):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Recipe not found"
+            )
+        return {"status": "success"}
+    except HTTPException:
+        raise
+    except ReadOnlyRecipeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Local development server; production runs gunicorn with gunicorn.conf.py
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        reload=os.getenv("UVICORN_RELOAD", "false").lower() == "true",
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "90")),
+    )
\ No newline at end of file
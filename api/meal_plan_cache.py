@@ -0,0 +1,217 @@
+"""Content-addressed cache for generated meal plans.
+
+A plan is keyed on a SHA-256 of the normalized preferences plus the exact
+prompt sent to the model, so any change to either produces a new key while
+identical requests are served without calling OpenAI. The backend is picked
+with ``MEAL_PLAN_CACHE_BACKEND`` (``memory``, ``sqlite`` or ``firestore``).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from models import UserPreferences
+from openai_service import MEAL_PLAN_GENERATION_MODE, MODEL, build_prompt
+
+MEAL_PLAN_CACHE_BACKEND = os.getenv("MEAL_PLAN_CACHE_BACKEND", "memory")
+MEAL_PLAN_CACHE_TTL_SECONDS = int(os.getenv("MEAL_PLAN_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+MEAL_PLAN_CACHE_MAX_SIZE = int(os.getenv("MEAL_PLAN_CACHE_MAX_SIZE", "512"))
+MEAL_PLAN_CACHE_PATH = os.getenv("MEAL_PLAN_CACHE_PATH", "./meal_plan_cache.db")
+MEAL_PLAN_CACHE_COLLECTION = os.getenv("MEAL_PLAN_CACHE_COLLECTION", "mealPlanCache")
+
+# List fields whose order carries no meaning
+_UNORDERED_FIELDS = {"dietary_restrictions", "cultural_background"}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def normalize_preferences(preferences: UserPreferences) -> Dict[str, Any]:
+    """Preferences minus storage-only fields, with stable ordering and whitespace."""
+    data = preferences.model_dump(exclude={"id", "user_id"})
+    normalized = {key: _normalize(value) for key, value in data.items()}
+    for field in _UNORDERED_FIELDS:
+        if isinstance(normalized.get(field), list):
+            normalized[field] = sorted({str(v).lower() for v in normalized[field]})
+    return normalized
+
+
+def cache_key(preferences: UserPreferences) -> str:
+    payload = {
+        "model": MODEL,
+        "mode": MEAL_PLAN_GENERATION_MODE,
+        "preferences": normalize_preferences(preferences),
+        "prompt": build_prompt(preferences),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """Per-process LRU; entries are lost on restart."""
+
+    def __init__(self, max_size: int = MEAL_PLAN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    async def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteCacheBackend:
+    """Single-file cache shared by every worker on the same host."""
+
+    def __init__(self, path: str = MEAL_PLAN_CACHE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meal_plan_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM meal_plan_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                conn.execute("DELETE FROM meal_plan_cache WHERE key = ?", (key,))
+                return None
+            return row[0]
+
+    def _set(self, key: str, value: str, ttl: int):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meal_plan_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+
+    def _delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM meal_plan_cache WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[str]:
+        return await run_in_threadpool(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await run_in_threadpool(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self._delete, key)
+
+
+class FirestoreCacheBackend:
+    """Cache shared across instances, stored in a top-level Firestore collection."""
+
+    def __init__(self, collection: str = MEAL_PLAN_CACHE_COLLECTION):
+        self.collection = collection
+
+    async def _ref(self, key: str):
+        from firestore_db import get_db
+        return (await get_db()).collection(self.collection).document(key)
+
+    async def get(self, key: str) -> Optional[str]:
+        doc = await (await self._ref(key)).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        if data['expiresAt'].timestamp() <= time.time():
+            return None
+        return data['value']
+
+    async def set(self, key: str, value: str, ttl: int):
+        await (await self._ref(key)).set({
+            'value': value,
+            'createdAt': datetime.utcnow(),
+            'expiresAt': datetime.utcnow() + timedelta(seconds=ttl),
+        })
+
+    async def delete(self, key: str):
+        await (await self._ref(key)).delete()
+
+
+BACKENDS = {
+    "memory": MemoryCacheBackend,
+    "sqlite": SQLiteCacheBackend,
+    "firestore": FirestoreCacheBackend,
+}
+
+
+class MealPlanCache:
+    def __init__(self, backend, ttl: int = MEAL_PLAN_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_generate(
+        self,
+        preferences: UserPreferences,
+        generate: Callable[[UserPreferences], Awaitable[str]],
+        force_refresh: bool = False,
+    ) -> str:
+        if not force_refresh:
+            cached = await self.lookup(preferences)
+            if cached is not None:
+                return cached
+        meal_plan = await generate(preferences)
+        await self.store(preferences, meal_plan)
+        return meal_plan
+
+    async def lookup(self, preferences: UserPreferences) -> Optional[str]:
+        cached = await self.backend.get(cache_key(preferences))
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached
+
+    async def store(self, preferences: UserPreferences, meal_plan: str):
+        # Only cache output the endpoint can actually use
+        json.loads(meal_plan)
+        await self.backend.set(cache_key(preferences), meal_plan, self.ttl)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+meal_plan_cache = MealPlanCache(BACKENDS[MEAL_PLAN_CACHE_BACKEND]())
@@ -0,0 +1,156 @@
+"""Incremental and tolerant parsing of a ``weeklyPlan`` completion.
+
+The model returns one JSON document shaped like
+``{"weeklyPlan": {"Monday": {"breakfast": {...}, ...}, ...}}``. The parser
+is fed the completion chunk by chunk and hands back each meal object as soon
+as its closing brace arrives, so the client can render Monday's breakfast
+while the rest of the week is still being generated.
+
+``parse_meal_plan`` uses the same parser to salvage the complete, valid days
+of a completion that was cut off at ``max_tokens`` or wrapped in a fence.
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+
+from models import DayPlan
+
+# Nesting depth of a meal object: root -> weeklyPlan -> day -> meal
+MEAL_DEPTH = 4
+
+
+class IncrementalPlanParser:
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        # (key, start offset, is_object) for every open container
+        self._stack: List[Tuple[Optional[str], int, bool]] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Consume ``chunk`` and return ``(day, meal, data)`` for each meal it completed."""
+        self.buffer += chunk
+        completed = []
+        while self._pos < len(self.buffer):
+            pos = self._pos
+            char = self.buffer[pos]
+            self._pos += 1
+
+            if not self._started:
+                # Skip any preamble or ```json fence before the document
+                if char == "{":
+                    self._started = True
+                    self._stack.append((None, pos, True))
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self.buffer[self._string_start:pos]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif char == ":":
+                self._pending_key = self._last_string
+            elif char == ",":
+                self._pending_key = None
+            elif char in "{[":
+                self._stack.append((self._pending_key, pos, char == "{"))
+                self._pending_key = None
+            elif char in "}]" and self._stack:
+                depth = len(self._stack)
+                key, start, is_object = self._stack.pop()
+                self._pending_key = None
+                path = [k for k, _, _ in self._stack[1:]] + [key]
+                if is_object and depth == MEAL_DEPTH and path[0] == "weeklyPlan":
+                    try:
+                        data = json.loads(self.buffer[start:pos + 1])
+                    except ValueError:
+                        continue
+                    completed.append((path[1], key, data))
+        return completed
+
+    @property
+    def complete(self) -> bool:
+        return self._started and not self._stack
+
+    def document(self) -> str:
+        """The JSON document text seen so far, without any surrounding fence."""
+        start = self.buffer.find("{")
+        end = self.buffer.rfind("}")
+        return self.buffer[start:end + 1] if start != -1 else ""
+
+
+def _complete_document(text: str) -> Optional[Dict[str, Any]]:
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_meal_plan(text: str, days: Sequence[str]) -> Tuple[Dict[str, Any], List[str]]:
+    """Parse a weekly completion into ``({"weeklyPlan": ...}, missing days)``.
+
+    Days that are absent, cut off or fail ``DayPlan`` validation are left out
+    of the plan and listed as missing, in ``days`` order.
+    """
+    document = _complete_document(text)
+    if document is not None and isinstance(document.get("weeklyPlan"), dict):
+        candidates = document["weeklyPlan"]
+    else:
+        # Truncated or otherwise broken: keep every meal whose object closed
+        candidates: Dict[str, Dict[str, Any]] = {}
+        for day, meal, data in IncrementalPlanParser().feed(text):
+            candidates.setdefault(day, {})[meal] = data
+
+    weekly_plan = {}
+    missing = []
+    for day in days:
+        try:
+            weekly_plan[day] = DayPlan.model_validate(candidates.get(day)).model_dump()
+        except ValidationError:
+            missing.append(day)
+    return {"weeklyPlan": weekly_plan}, missing
+
+
+def iter_meals(plan: Dict[str, Any]):
+    """Yield ``(day, meal, data)`` for every meal of an already complete plan."""
+    for day, meals in plan.get("weeklyPlan", {}).items():
+        for meal, data in meals.items():
+            yield day, meal, data
+
+
+def summarize_meal_plan(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a plan (or stored plan document) without the meal ``instructions``."""
+    if "plan" in data:
+        return data | {"plan": summarize_meal_plan(data["plan"])}
+    weekly_plan = {
+        day: {
+            meal: {k: v for k, v in details.items() if k != "instructions"}
+            if isinstance(details, dict) else details
+            for meal, details in meals.items()
+        }
+        for day, meals in data.get("weeklyPlan", {}).items()
+    }
+    return data | {"weeklyPlan": weekly_plan}
+
+
+def ndjson_event(event_type: str, **fields) -> str:
+    return json.dumps({"type": event_type, **fields}, default=str) + "\n"
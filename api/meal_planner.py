@@ -0,0 +1,214 @@
+"""Weekly meal plans assembled from the recipe library, with the LLM only filling gaps.
+
+For each day the assembler fills breakfast, lunch and dinner in turn. Each
+meal aims at its share of what the day still needs (``MEAL_SHARES`` of the
+calorie and protein targets). Candidates are the recipes tagged with the
+meal and every dietary restriction, and within that day's prep time for the
+meal. They are scored on their deviation from the meal's share plus a
+penalty for each earlier use in the week. A recipe is never used twice in a
+day or more than ``MEAL_PLAN_MAX_REPEATS`` times in a week.
+
+Scoring is a loop over the candidates' parallel macro lists, so the result
+is deterministic for given preferences and library.
+
+A slot without a candidate, and the dinner of a day that misses its targets,
+is left to one ``generate_meal`` completion aimed at what the day still
+needs. With more than ``MEAL_PLAN_LIBRARY_MAX_LLM_SLOTS`` such slots the
+library is too thin for these preferences, and the week is generated as
+before.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models import UserPreferences
+from openai_service import MEALS, check_daily_targets, generate_meal, plan_days
+from recipe_library import normalize_tag, parse_minutes, recipe_library
+
+logger = logging.getLogger(__name__)
+
+MEAL_PLAN_LIBRARY = os.getenv("MEAL_PLAN_LIBRARY", "true").lower() == "true"
+MEAL_PLAN_LIBRARY_MAX_LLM_SLOTS = int(os.getenv("MEAL_PLAN_LIBRARY_MAX_LLM_SLOTS", "6"))
+MEAL_PLAN_MAX_REPEATS = int(os.getenv("MEAL_PLAN_MAX_REPEATS", "2"))
+# Score added per earlier use of a recipe this week; a squared deviation of
+# 0.05 is about 22% of a target
+MEAL_PLAN_VARIETY_WEIGHT = float(os.getenv("MEAL_PLAN_VARIETY_WEIGHT", "0.05"))
+MEAL_SHARES = {"breakfast": 0.25, "lunch": 0.35, "dinner": 0.40}
+
+# (day, meal, calorie and protein targets for the meal)
+Slot = Tuple[str, str, Dict[str, float]]
+
+
+class MealPlannerStats:
+    def __init__(self):
+        self.plans = 0
+        self.fallbacks = 0
+        self.library_errors = 0
+        self.library_meals = 0
+        self.generated_meals = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "plans": self.plans,
+            "fallbacks": self.fallbacks,
+            "library_errors": self.library_errors,
+            "library_meals": self.library_meals,
+            "generated_meals": self.generated_meals,
+        }
+
+
+meal_planner_stats = MealPlannerStats()
+
+
+class Candidates:
+    """The recipes eligible for one meal type, as parallel arrays."""
+
+    def __init__(self, ids: List[int], positions: List[int], calories: List[float], protein: List[float],
+                 minutes: List[float]):
+        self.ids = ids
+        self.positions = positions
+        self.calories = calories
+        self.protein = protein
+        self.minutes = minutes
+
+
+def _deviation(value: float, target: float, daily: float) -> float:
+    return ((value - target) / daily) ** 2 if daily else 0.0
+
+
+def _best(candidates: Candidates, targets: Dict[str, float], daily: Dict[str, float], max_minutes: float,
+          uses: List[int], today: List[int]) -> Optional[int]:
+    """Index of the lowest-scoring eligible candidate, or None."""
+    best, best_score = None, math.inf
+    for i, position in enumerate(candidates.positions):
+        if candidates.minutes[i] > max_minutes or uses[position] >= MEAL_PLAN_MAX_REPEATS or position in today:
+            continue
+        score = (
+            _deviation(candidates.calories[i], targets["calories"], daily["calories"])
+            + _deviation(candidates.protein[i], targets["protein"], daily["protein"])
+            + MEAL_PLAN_VARIETY_WEIGHT * uses[position]
+        )
+        if score < best_score:
+            best, best_score = i, score
+    return best
+
+
+def _to_meal(recipe: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "recipe": recipe["name"],
+        "prepTime": recipe["prep_time"],
+        "calories": recipe["calories"],
+        "protein": recipe["protein"],
+        "image": recipe["image"],
+        "ayurvedic": recipe["ayurvedic"],
+        "ingredients": recipe["ingredients"],
+        "instructions": recipe["instructions"],
+        "recipeId": recipe["id"],
+    }
+
+
+def assemble_meal_plan(preferences: UserPreferences) -> Tuple[Dict[str, Any], List[Slot]]:
+    """The plan the library can fill, and the slots it could not, in day order."""
+    index = recipe_library.index
+    restrictions = [normalize_tag(restriction) for restriction in preferences.dietary_restrictions or []]
+    positions: Dict[int, int] = {}
+    candidates: Dict[str, Candidates] = {}
+    for meal in MEALS:
+        ids = index.search(tags=[meal, *restrictions])
+        recipes = [index.recipes[recipe_id] for recipe_id in ids]
+        minutes = [index.prep_minutes(recipe_id) for recipe_id in ids]
+        candidates[meal] = Candidates(
+            ids,
+            [positions.setdefault(recipe_id, len(positions)) for recipe_id in ids],
+            [recipe["calories"] for recipe in recipes],
+            [recipe["protein"] for recipe in recipes],
+            [math.inf if value is None else value for value in minutes],
+        )
+    uses = [0] * len(positions)
+
+    targets = preferences.targets or {}
+    daily = {field: float(targets.get(field) or 0) for field in ("calories", "protein")}
+    weekly_plan: Dict[str, Dict[str, Any]] = {}
+    unfilled: List[Slot] = []
+    for day in plan_days(preferences):
+        times = preferences.time_availability.get(day) or {}
+        remaining = dict(daily)
+        share_left = 1.0
+        day_plan: Dict[str, Any] = {}
+        day_slots: List[Slot] = []
+        today: List[int] = []
+        for meal in MEALS:
+            share = MEAL_SHARES[meal] / share_left
+            meal_targets = {field: max(value, 0.0) * share for field, value in remaining.items()}
+            limit = parse_minutes(str(times[meal])) if times.get(meal) else None
+            best = _best(candidates[meal], meal_targets, daily, math.inf if limit is None else limit, uses, today)
+            share_left -= MEAL_SHARES[meal]
+            if best is None:
+                # Assume the generated meal hits its share
+                day_slots.append((day, meal, meal_targets))
+                for field in remaining:
+                    remaining[field] -= meal_targets[field]
+                continue
+            recipe = index.recipes[candidates[meal].ids[best]]
+            position = int(candidates[meal].positions[best])
+            uses[position] += 1
+            today.append(position)
+            day_plan[meal] = _to_meal(recipe)
+            for field in remaining:
+                remaining[field] -= recipe[field]
+
+        # Dinner is picked against what is left, so if a day filled from the
+        # library still misses its targets no recipe fits; generate a dinner that does
+        if len(day_plan) == len(MEALS) and check_daily_targets(day_plan, daily):
+            dinner = day_plan.pop("dinner")
+            uses[positions[dinner["recipeId"]]] -= 1
+            day_slots.append((day, "dinner", {
+                field: max(remaining[field] + dinner[field], 0.0) for field in remaining
+            }))
+        weekly_plan[day] = day_plan
+        unfilled += day_slots
+    return {"weeklyPlan": weekly_plan}, unfilled
+
+
+async def plan_from_library(preferences: UserPreferences) -> Optional[Dict[str, Any]]:
+    """A plan assembled from the library, or None when too many slots would need the LLM.
+
+    Also None when the library cannot be read (database down, table not
+    migrated): it is only a shortcut, so the week is generated instead.
+    """
+    if not MEAL_PLAN_LIBRARY:
+        return None
+    try:
+        await recipe_library.ensure_loaded()
+        plan, unfilled = assemble_meal_plan(preferences)
+    except Exception as e:
+        logger.exception("Recipe library unavailable, generating the whole plan: %s", e)
+        meal_planner_stats.library_errors += 1
+        return None
+    if len(unfilled) > MEAL_PLAN_LIBRARY_MAX_LLM_SLOTS:
+        meal_planner_stats.fallbacks += 1
+        return None
+    if unfilled:
+        meals = await asyncio.gather(*(generate_meal(preferences, day, meal, targets) for day, meal, targets in unfilled))
+        for (day, meal, _), data in zip(unfilled, meals):
+            plan["weeklyPlan"][day][meal] = data
+    for day, day_plan in plan["weeklyPlan"].items():
+        plan["weeklyPlan"][day] = {meal: day_plan[meal] for meal in MEALS}
+    meal_planner_stats.plans += 1
+    meal_planner_stats.generated_meals += len(unfilled)
+    meal_planner_stats.library_meals += len(plan["weeklyPlan"]) * len(MEALS) - len(unfilled)
+    return plan
+
+
+def library_first(generate: Callable[[UserPreferences], Awaitable[str]]) -> Callable[[UserPreferences], Awaitable[str]]:
+    """``generate``, tried only when the library cannot assemble the plan."""
+    async def generate_from_library(preferences: UserPreferences) -> str:
+        plan = await plan_from_library(preferences)
+        if plan is None:
+            return await generate(preferences)
+        return json.dumps(plan)
+
+    return generate_from_library
@@ -0,0 +1,215 @@
+"""Latency instrumentation exposed in Prometheus text format at ``/metrics``.
+
+* ``TimingMiddleware`` records every request per route template and status
+  in ``http_request_duration_seconds`` plus an in-flight gauge.
+* ``span(dependency, operation)`` times a call to an external dependency
+  (``auth``, ``db`` or ``llm``) into ``dependency_duration_seconds`` and
+  counts failures in ``dependency_errors_total``; ``instrument`` applies it
+  to every coroutine method of a class.
+* ``register_collector`` publishes the ``stats()`` dicts of the in-process
+  caches and limiters as gauges.
+
+Percentiles per dependency come from the histograms, e.g.
+``histogram_quantile(0.99, sum by (le, dependency) (rate(dependency_duration_seconds_bucket[5m])))``.
+Values are per worker process.
+"""
+import functools
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with _lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, *labels: str, value: float):
+        with _lock:
+            entry = self._values.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {count}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ("method",))
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_duration_seconds", "Latency of calls to auth, db and llm", ("dependency", "operation")
+)
+DEPENDENCY_ERRORS = Counter(
+    "dependency_errors_total", "Failed calls to auth, db and llm", ("dependency", "operation")
+)
+DEPENDENCY_IN_FLIGHT = Gauge(
+    "dependency_calls_in_flight", "Calls to auth, db and llm currently outstanding", ("dependency",)
+)
+
+METRICS = [REQUEST_LATENCY, REQUESTS_IN_FLIGHT, DEPENDENCY_LATENCY, DEPENDENCY_ERRORS, DEPENDENCY_IN_FLIGHT]
+
+_collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def register_collector(prefix: str, stats: Callable[[], Dict[str, float]]):
+    """Publish each numeric entry of ``stats()`` as gauge ``vital_bites_<prefix>_<key>``."""
+    _collectors[prefix] = stats
+
+
+@contextmanager
+def span(dependency: str, operation: str):
+    DEPENDENCY_IN_FLIGHT.inc(dependency)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.inc(dependency, operation)
+        raise
+    finally:
+        DEPENDENCY_LATENCY.observe(dependency, operation, value=time.perf_counter() - start)
+        DEPENDENCY_IN_FLIGHT.dec(dependency)
+
+
+def instrument(dependency: str):
+    """Class decorator: wrap every coroutine static method in a ``span``."""
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if isinstance(attr, staticmethod) and inspect.iscoroutinefunction(attr.__func__):
+                setattr(cls, name, staticmethod(_traced(dependency, name, attr.__func__)))
+        return cls
+    return decorate
+
+
+def _traced(dependency: str, operation: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with span(dependency, operation):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    for prefix, stats in sorted(_collectors.items()):
+        for key, value in sorted(stats().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", f"vital_bites_{prefix}_{key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(method)
+            # The router stores the matched route in the scope, admission control
+            # the endpoint it rejected; other unmatched paths share one label
+            # to keep cardinality bounded
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or scope.get("route_path", "unmatched")
+            REQUEST_LATENCY.observe(method, route_path, str(status_code), value=time.perf_counter() - start)
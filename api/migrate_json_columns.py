@@ -0,0 +1,125 @@
+"""Convert ``recipe`` and ``userpreferences`` to native JSON columns.
+
+Two older layouts are handled:
+
+* ``<field>_json`` VARCHAR columns holding JSON text (the first schema)
+* ``<field>`` JSON columns holding a JSON *string* of the JSON text, as
+  written by the str-typed model fields (double encoded)
+
+SQLite tables are rebuilt from the current models, which also drops the
+``NOT NULL`` on ``recipe.user_id`` that harvested recipes need. On Postgres
+the columns are renamed where needed and converted to JSONB in place.
+Recipes whose names differ only in case or surrounding spaces are reduced
+to the oldest one, so the unique ``ux_recipe_name`` index can be created.
+Running it again on a migrated database changes nothing.
+
+    python migrate_json_columns.py                        # DATABASE_URL from database.py
+    python migrate_json_columns.py --database-url sqlite:///../backup/vital_bites.db
+"""
+import argparse
+import json
+from typing import Any, Dict, List
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+
+from models import RECIPE_NAME_INDEX, Recipe, UserPreferences
+
+MODELS = (Recipe, UserPreferences)
+JSON_FIELDS = {
+    Recipe.__tablename__: {"tags": list, "ingredients": list, "instructions": list},
+    UserPreferences.__tablename__: {
+        "targets": dict,
+        "health_focus": dict,
+        "dietary_restrictions": list,
+        "time_availability": dict,
+        "cultural_background": list,
+    },
+}
+
+
+def decode(value: Any, default: type) -> Any:
+    """A stored value as a list/dict, however many times it was JSON encoded."""
+    while isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return default()
+    return default() if value is None else value
+
+
+def _migrate_sqlite(conn: Connection, model, columns: List[str]) -> int:
+    table = model.__table__
+    fields = JSON_FIELDS[table.name]
+    rows = conn.exec_driver_sql(f'SELECT * FROM "{table.name}"').mappings().all()
+    migrated: List[Dict[str, Any]] = []
+    seen = set()
+    for row in sorted(rows, key=lambda row: row["id"]):
+        if table.name == Recipe.__tablename__:
+            name = row["name"].strip().lower()
+            if name in seen:
+                continue
+            seen.add(name)
+        data = {column.name: row[column.name] for column in table.columns if column.name in row}
+        for field, default in fields.items():
+            data[field] = json.dumps(decode(row.get(field, row.get(f"{field}_json")), default))
+        migrated.append(data)
+
+    # Index names are per database, and the renamed table would keep them
+    for index in table.indexes:
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}_old"')
+    table.create(conn)
+    if migrated:
+        names = list(migrated[0])
+        conn.exec_driver_sql(
+            f'INSERT INTO "{table.name}" ({", ".join(names)}) VALUES ({", ".join("?" for _ in names)})',
+            [tuple(data[name] for name in names) for data in migrated],
+        )
+    conn.exec_driver_sql(f'DROP TABLE "{table.name}_old"')
+    return len(migrated)
+
+
+def _migrate_postgres(conn: Connection, model, columns: List[str]) -> int:
+    table = model.__tablename__
+    for field in JSON_FIELDS[table]:
+        if f"{field}_json" in columns and field not in columns:
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" RENAME COLUMN {field}_json TO {field}')
+        conn.exec_driver_sql(
+            f'ALTER TABLE "{table}" ALTER COLUMN {field} TYPE JSONB USING ('
+            f"CASE WHEN json_typeof({field}::json) = 'string' THEN ({field}::json #>> '{{}}')::jsonb "
+            f"ELSE {field}::jsonb END)"
+        )
+    if table == Recipe.__tablename__:
+        conn.exec_driver_sql(f'ALTER TABLE "{table}" ALTER COLUMN user_id DROP NOT NULL')
+        conn.exec_driver_sql(
+            f'DELETE FROM "{table}" newer USING "{table}" older '
+            "WHERE newer.id > older.id AND lower(trim(newer.name)) = lower(trim(older.name))"
+        )
+        conn.execute(CreateIndex(RECIPE_NAME_INDEX, if_not_exists=True))
+    return conn.exec_driver_sql(f'SELECT count(*) FROM "{table}"').scalar()
+
+
+def migrate(database_url: str):
+    engine = create_engine(database_url)
+    migrate_table = _migrate_sqlite if engine.dialect.name == "sqlite" else _migrate_postgres
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for model in MODELS:
+            table = model.__tablename__
+            if not inspector.has_table(table):
+                print(f"{table}: no table, skipped")
+                continue
+            columns = [column["name"] for column in inspector.get_columns(table)]
+            print(f"{table}: {migrate_table(conn, model, columns)} rows migrated")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    from database import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    args = parser.parse_args()
+    migrate(args.database_url)
@@ -1,8 +1,13 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy import Index, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import SQLModel, Field, JSON
-from pydantic import EmailStr
-import json
+from pydantic import BaseModel, ConfigDict, EmailStr
+
+# Lists and dicts are stored as native JSON (JSONB on Postgres) and decoded
+# once when a row is loaded; migrate_json_columns.py converts older databases
+JSONColumn = JSON().with_variant(JSONB(), "postgresql")
 
 class UserBase(SQLModel):
     email: str = Field(unique=True, index=True)
@@ -35,6 +40,22 @@ class RecipeBase(SQLModel):
 class RecipeCreate(RecipeBase):
     pass
 
+class RecipeUpdate(SQLModel):
+    # Partial update: only the fields the client sends are validated and written
+    name: Optional[str] = None
+    image: Optional[str] = None
+    prep_time: Optional[str] = None
+    servings: Optional[int] = None
+    difficulty: Optional[str] = None
+    ayurvedic: Optional[str] = None
+    tags: Optional[List[str]] = None
+    ingredients: Optional[List[str]] = None
+    instructions: Optional[List[str]] = None
+    calories: Optional[int] = None
+    protein: Optional[int] = None
+    carbs: Optional[int] = None
+    fat: Optional[int] = None
+
 class Recipe(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
@@ -43,34 +64,21 @@ class Recipe(SQLModel, table=True):
     servings: int
     difficulty: str
     ayurvedic: str
-    tags: str = Field(sa_type=JSON, default='[]')
-    ingredients: str = Field(sa_type=JSON, default='[]')
-    instructions: str = Field(sa_type=JSON, default='[]')
+    tags: List[str] = Field(default_factory=list, sa_type=JSONColumn)
+    ingredients: List[str] = Field(default_factory=list, sa_type=JSONColumn)
+    instructions: List[str] = Field(default_factory=list, sa_type=JSONColumn)
     calories: int
     protein: int
     carbs: int
     fat: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    # Firebase uid of the user who created it; harvested recipes have none and are read-only
+    owner_id: Optional[str] = None
 
-    def __init__(self, **data):
-        # Convert list fields to JSON strings for database storage
-        for field in ['tags', 'ingredients', 'instructions']:
-            if field in data and isinstance(data[field], list):
-                data[field] = json.dumps(data[field])
-        super().__init__(**data)
-
-    @property
-    def tags_list(self) -> List[str]:
-        return json.loads(self.tags)
-
-    @property
-    def ingredients_list(self) -> List[str]:
-        return json.loads(self.ingredients)
-
-    @property
-    def instructions_list(self) -> List[str]:
-        return json.loads(self.instructions)
+# One recipe per name, whatever its case and surrounding spaces; every worker
+# harvests into the same table, so the dedup has to happen in the database
+RECIPE_NAME_INDEX = Index("ux_recipe_name", func.lower(func.trim(Recipe.__table__.c.name)), unique=True)
 
 class RecipeRead(RecipeBase):
     id: int
@@ -80,41 +88,83 @@ class RecipeRead(RecipeBase):
 class UserPreferences(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
-    targets: str = Field(sa_type=JSON, default='{}')
-    health_focus: str = Field(sa_type=JSON, default='{}')
-    dietary_restrictions: str = Field(sa_type=JSON, default='[]')
-    time_availability: str = Field(sa_type=JSON, default='{}')
+    targets: Dict[str, Any] = Field(default_factory=dict, sa_type=JSONColumn)
+    health_focus: Dict[str, Any] = Field(default_factory=dict, sa_type=JSONColumn)
+    dietary_restrictions: List[str] = Field(default_factory=list, sa_type=JSONColumn)
+    time_availability: Dict[str, Dict[str, Any]] = Field(default_factory=dict, sa_type=JSONColumn)
     about: str = Field(default="")
     favorite_foods: str = Field(default="")
     sample_meal_plan: str = Field(default="")
     social_media_favorites: str = Field(default="")
     familiarity_level: int = Field(default=50)
-    cultural_background: str = Field(sa_type=JSON, default='[]')
-
-    def __init__(self, **data):
-        # Convert dict/list fields to JSON strings for database storage
-        for field in ['targets', 'health_focus', 'dietary_restrictions', 'time_availability', 'cultural_background']:
-            if field in data:
-                if isinstance(data[field], (dict, list)):
-                    data[field] = json.dumps(data[field])
-        super().__init__(**data)
-
-    @property
-    def targets_dict(self) -> dict:
-        return json.loads(self.targets)
-
-    @property
-    def health_focus_dict(self) -> dict:
-        return json.loads(self.health_focus)
-
-    @property
-    def dietary_restrictions_list(self) -> List[str]:
-        return json.loads(self.dietary_restrictions)
-
-    @property
-    def time_availability_dict(self) -> dict:
-        return json.loads(self.time_availability)
-
-    @property
-    def cultural_background_list(self) -> List[str]:
-        return json.loads(self.cultural_background)
\ No newline at end of file
+    cultural_background: List[str] = Field(default_factory=list, sa_type=JSONColumn)
+
+# Tables for the SQL storage backend (STORAGE_BACKEND=sql). They hold the
+# same documents as the Firestore collections, keyed by the Firebase uid,
+# with the timestamps in their own columns.
+class UserDocument(SQLModel, table=True):
+    user_id: str = Field(primary_key=True)
+    data: Dict[str, Any] = Field(default_factory=dict, sa_type=JSONColumn)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PreferencesDocument(SQLModel, table=True):
+    user_id: str = Field(primary_key=True)
+    data: Dict[str, Any] = Field(default_factory=dict, sa_type=JSONColumn)
+    updated_at: Optional[datetime] = None
+
+class MealPlanDocument(SQLModel, table=True):
+    user_id: str = Field(primary_key=True)
+    plan: Dict[str, Any] = Field(default_factory=dict, sa_type=JSONColumn)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ShoppingItemDocument(SQLModel, table=True):
+    # The same composite indexes as the shoppingList ones in firestore.indexes.json
+    __table_args__ = (
+        Index("ix_shoppingitem_created", "user_id", "created_at", "id"),
+        Index("ix_shoppingitem_checked_created", "user_id", "checked", "created_at", "id"),
+        Index("ix_shoppingitem_category_created", "user_id", "category", "created_at", "id"),
+        Index("ix_shoppingitem_checked_category_created", "user_id", "checked", "category", "created_at", "id"),
+        Index("ix_shoppingitem_updated", "user_id", "updated_at"),
+    )
+
+    # Item ids are unique per user, like documents in a subcollection
+    user_id: str = Field(primary_key=True)
+    id: str = Field(primary_key=True)
+    source: Optional[str] = Field(default=None, index=True)
+    # Copied out of data for the list filters
+    checked: Optional[bool] = None
+    category: Optional[str] = None
+    data: Dict[str, Any] = Field(default_factory=dict, sa_type=JSONColumn)
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class ShoppingItemTombstone(SQLModel, table=True):
+    """A deleted shopping item, kept for delta sync like the shoppingListTombstones documents."""
+    __table_args__ = (Index("ix_shoppingitemtombstone_deleted", "user_id", "deleted_at"),)
+
+    user_id: str = Field(primary_key=True)
+    id: str = Field(primary_key=True)
+    deleted_at: datetime
+
+# Shape of a generated meal plan. Extra keys the model adds are kept.
+class PlannedMeal(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    recipe: str
+    prepTime: str = ""
+    calories: Union[int, float] = 0
+    protein: Union[int, float] = 0
+    image: str = ""
+    ayurvedic: str = ""
+    ingredients: List[str] = []
+    instructions: List[str] = []
+
+class DayPlan(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    breakfast: PlannedMeal
+    lunch: PlannedMeal
+    dinner: PlannedMeal
+
+class WeeklyMealPlan(BaseModel):
+    weeklyPlan: Dict[str, DayPlan]
@@ -1,98 +1,436 @@
-from typing import Dict, Any
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Any, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
 import os
-import openai
+import time
 from dotenv import load_dotenv
-from models import UserPreferences
+from fastapi.concurrency import run_in_threadpool
+from meal_plan_stream import parse_meal_plan
+from metrics import span
+from models import DayPlan, PlannedMeal, UserPreferences
+from token_budget import completion_budget, count_message_tokens, count_tokens, load_encoding, token_accounting
+
+if TYPE_CHECKING:
+    # The SDK (and httpx) take a large share of cold start; they are imported
+    # when the client is first created, off the startup path
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 # Configure OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Point at a compatible server instead of api.openai.com, e.g. benchmarks.mock_openai
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+MODEL = "gpt-4"
+
+# Shared client: connection pool, timeouts and a cap on in-flight completions
+OPENAI_TIMEOUT_SECONDS = float(os.getenv('OPENAI_TIMEOUT_SECONDS', '120'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY_SECONDS', '60'))
+OPENAI_MAX_CONCURRENT_COMPLETIONS = int(os.getenv('OPENAI_MAX_CONCURRENT_COMPLETIONS', '8'))
+
+# "week" asks for the whole plan in one completion; "per_day" fans out one completion per day
+MEAL_PLAN_GENERATION_MODE = os.getenv('MEAL_PLAN_GENERATION_MODE', 'week')
+MEAL_PLAN_DAY_CONCURRENCY = int(os.getenv('MEAL_PLAN_DAY_CONCURRENCY', '7'))
+MEAL_PLAN_DAY_RETRIES = int(os.getenv('MEAL_PLAN_DAY_RETRIES', '1'))
+# Allowed relative deviation of a day's totals from the calorie/protein targets
+MEAL_PLAN_TARGET_TOLERANCE = float(os.getenv('MEAL_PLAN_TARGET_TOLERANCE', '0.15'))
+
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MEALS = ["breakfast", "lunch", "dinner"]
+
+# The meal shape, spelled out once in compact form instead of an indented example
+MEAL_SCHEMA = (
+    '{"recipe":str,"prepTime":"N mins","calories":int,"protein":int,"image":unsplash_url,'
+    '"ayurvedic":dosha_balance,"ingredients":[str],"instructions":[str]}'
+)
+PLAN_RULES = (
+    "Rules: each day's meals together meet the daily targets; respect the dietary restrictions "
+    "and prep times; apply Ayurvedic principles; use realistic Unsplash food photo URLs; "
+    "list ingredients with quantities and give concise steps."
+)
+
+def _preference_lines(preferences: UserPreferences) -> List[str]:
+    """One line per preference that is set; empty sections are left out of the prompt."""
+    lines = []
+    targets = preferences.targets or {}
+    target_parts = []
+    if targets.get('calories'):
+        target_parts.append(f"{targets['calories']} kcal")
+    if targets.get('protein'):
+        target_parts.append(f"{targets['protein']}g protein")
+    if target_parts:
+        lines.append("Daily targets: " + ", ".join(target_parts))
+    health_focus = preferences.health_focus or {}
+    focus = [health_focus[key] for key in ('primary', 'secondary') if health_focus.get(key)]
+    if focus:
+        lines.append("Health focus: " + ", ".join(focus))
+    if preferences.dietary_restrictions:
+        lines.append("Dietary restrictions: " + ", ".join(preferences.dietary_restrictions))
+    if preferences.cultural_background:
+        lines.append("Cultural background: " + ", ".join(preferences.cultural_background))
+    lines.append(f"Adventurousness: {preferences.familiarity_level}/100")
+    if preferences.about and preferences.about.strip():
+        lines.append(f"About: {preferences.about.strip()}")
+    if preferences.favorite_foods and preferences.favorite_foods.strip():
+        lines.append(f"Favorite foods: {preferences.favorite_foods.strip()}")
+    return lines
+
+def _prep_minutes(times: Dict[str, Any]) -> str:
+    return "/".join(str(times.get(meal, "-")) for meal in MEALS)
 
 def build_prompt(preferences: UserPreferences) -> str:
-    time_availability = "\n".join([
-        f"{day}:\n    - Breakfast: {times['breakfast']} minutes\n    - Lunch: {times['lunch']} minutes\n    - Dinner: {times['dinner']} minutes"
-        for day, times in preferences.time_availability.items()
-    ])
-
-    return f"""
-Generate a personalized weekly meal plan based on the following preferences:
-
-Daily Targets:
-- Calories: {preferences.targets['calories']}
-- Protein: {preferences.targets['protein']}g
-
-Health Focus:
-- Primary: {preferences.health_focus['primary']}
-- Secondary: {preferences.health_focus['secondary']}
-
-Dietary Restrictions: {', '.join(preferences.dietary_restrictions)}
-
-Time Availability:
-{time_availability}
-
-Cultural Background: {', '.join(preferences.cultural_background)}
-Familiarity Level: {preferences.familiarity_level}% (higher means more adventurous)
-
-Additional Information:
-{preferences.about}
-
-Favorite Foods: {preferences.favorite_foods}
-
-Please generate a weekly meal plan in the following JSON format:
-{{
-  "weeklyPlan": {{
-    "Monday": {{
-      "breakfast": {{
-        "recipe": "Recipe Name",
-        "prepTime": "XX mins",
-        "calories": XXX,
-        "protein": XX,
-        "image": "unsplash_url",
-        "ayurvedic": "dosha_balance",
-        "ingredients": ["ingredient1", "ingredient2"],
-        "instructions": ["step1", "step2"]
-      }},
-      "lunch": {{ ... }},
-      "dinner": {{ ... }}
-    }},
-    "Tuesday": {{ ... }},
-    ...
-  }}
-}}
-
-Ensure all recipes:
-1. Meet the daily calorie and protein targets when combined
-2. Respect dietary restrictions
-3. Can be prepared within the specified time limits
-4. Include appropriate Ayurvedic principles
-5. Use realistic Unsplash image URLs for food photography
-6. Include detailed ingredients and instructions
-"""
-
-async def generate_meal_plan(preferences: UserPreferences) -> Dict[str, Any]:
+    days = plan_days(preferences)
+    lines = [f"Create a meal plan for {len(days)} days ({', '.join(days)}) with breakfast, lunch and dinner."]
+    lines += _preference_lines(preferences)
+    if preferences.time_availability:
+        lines.append("Max prep minutes (breakfast/lunch/dinner): " + "; ".join(
+            f"{day[:3]} {_prep_minutes(preferences.time_availability[day])}"
+            for day in days if day in preferences.time_availability
+        ))
+    lines.append(PLAN_RULES)
+    lines.append(
+        'Reply with JSON only: {"weeklyPlan":{"<Day>":{"breakfast":M,"lunch":M,"dinner":M}}} where M = '
+        + MEAL_SCHEMA
+    )
+    return "\n".join(lines)
+
+def build_messages(preferences: UserPreferences) -> List[Dict[str, str]]:
+    return _messages(build_prompt(preferences))
+
+def _messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {
+            "role": "system",
+            "content": "You are a professional nutritionist and meal planner with expertise in Ayurvedic principles."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+class OpenAIMetrics:
+    """Queue depth, in-flight count and upstream latency of completion calls."""
+
+    def __init__(self, window: int = 1000):
+        self.queued = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=window)
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "latency_p50_seconds": pct(0.50),
+            "latency_p95_seconds": pct(0.95),
+            "latency_p99_seconds": pct(0.99),
+        }
+
+openai_metrics = OpenAIMetrics()
+
+_async_client: Optional["AsyncOpenAI"] = None
+_completion_slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENT_COMPLETIONS)
+# In-flight completions by request fingerprint, so identical prompts share one upstream call
+_inflight_completions: Dict[str, asyncio.Future] = {}
+
+def create_async_client() -> "AsyncOpenAI":
+    import httpx
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=OPENAI_TIMEOUT_SECONDS,
+    )
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+async def init_openai_client():
+    """Create the shared client and load the tokenizer; called once from the app lifespan.
+
+    Creation (and the SDK import) runs in a worker thread so it does not hold
+    up the event loop while the app is already serving.
+    """
+    global _async_client
+    if _async_client is None:
+        client = await run_in_threadpool(create_async_client)
+        if _async_client is None:
+            _async_client = client
+        else:
+            # A request created one on first use in the meantime
+            await client.close()
+    await run_in_threadpool(load_encoding, MODEL)
+
+async def close_openai_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+def get_async_client() -> "AsyncOpenAI":
+    global _async_client
+    if _async_client is None:
+        # Outside the app lifespan (scripts, benchmarks) create it on first use
+        _async_client = create_async_client()
+    return _async_client
+
+@asynccontextmanager
+async def completion_slot(operation: str = "chat_completion"):
+    """Hold one of the ``OPENAI_MAX_CONCURRENT_COMPLETIONS`` upstream slots."""
+    openai_metrics.queued += 1
     try:
-        response = await openai.ChatCompletion.acreate(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a professional nutritionist and meal planner with expertise in Ayurvedic principles."
-                },
-                {
-                    "role": "user",
-                    "content": build_prompt(preferences)
-                }
-            ],
-            temperature=0.7,
-            max_tokens=2000
+        await _completion_slots.acquire()
+    finally:
+        openai_metrics.queued -= 1
+    openai_metrics.in_flight += 1
+    openai_metrics.requests += 1
+    start = time.perf_counter()
+    try:
+        with span("llm", operation):
+            yield
+    except Exception:
+        openai_metrics.errors += 1
+        raise
+    finally:
+        openai_metrics.latencies.append(time.perf_counter() - start)
+        openai_metrics.in_flight -= 1
+        _completion_slots.release()
+
+async def _create_completion(params: Dict[str, Any], meals: int) -> str:
+    async with completion_slot():
+        start = time.perf_counter()
+        response = await get_async_client().chat.completions.create(**params)
+        seconds = time.perf_counter() - start
+    content = response.choices[0].message.content
+    usage = response.usage
+    token_accounting.record(
+        usage.prompt_tokens if usage else count_message_tokens(params["messages"], params["model"]),
+        usage.completion_tokens if usage else count_tokens(content or "", params["model"]),
+        params.get("max_tokens", 0),
+        response.choices[0].finish_reason,
+        seconds,
+        meals,
+    )
+    return content
+
+async def create_completion(meals: int = 0, **params) -> str:
+    """Run a chat completion and return its text, coalescing identical concurrent requests.
+
+    ``meals`` is the number of meals requested, for the per-meal token accounting.
+    """
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+    completion = _inflight_completions.get(key)
+    if completion is None:
+        completion = asyncio.ensure_future(_create_completion(params, meals))
+        _inflight_completions[key] = completion
+        completion.add_done_callback(lambda _: _inflight_completions.pop(key, None))
+    else:
+        openai_metrics.coalesced += 1
+    return await asyncio.shield(completion)
+
+async def generate_meal_plan(preferences: UserPreferences) -> str:
+    """Generate the week in one completion; returns the validated plan as JSON text."""
+    try:
+        days = plan_days(preferences)
+        content = await create_completion(
+            meals=len(days) * len(MEALS),
+            **completion_params(build_messages(preferences), len(days))
         )
-        
-        # Parse and return the generated meal plan
-        meal_plan = response.choices[0].message.content
-        return meal_plan
+        plan, _ = await repair_meal_plan(preferences, content)
+        return json.dumps(plan)
+
+    except Exception as e:
+        logger.exception("Error generating meal plan: %s", e)
+        raise
+
+async def stream_meal_plan(preferences: UserPreferences) -> AsyncIterator[str]:
+    """Yield the completion text in chunks as the model produces it."""
+    try:
+        days = plan_days(preferences)
+        params = completion_params(build_messages(preferences), len(days))
+        chunks = []
+        finish_reason = None
+        async with completion_slot("chat_completion_stream"):
+            start = time.perf_counter()
+            stream = await get_async_client().chat.completions.create(**params, stream=True)
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            seconds = time.perf_counter() - start
+        # Streamed responses carry no usage, so both sides are counted locally
+        token_accounting.record(
+            count_message_tokens(params["messages"], MODEL),
+            count_tokens("".join(chunks), MODEL),
+            params["max_tokens"],
+            finish_reason,
+            seconds,
+            len(days) * len(MEALS),
+        )
+
+    except Exception as e:
+        logger.exception("Error streaming meal plan: %s", e)
+        raise
+
+def build_day_prompt(preferences: UserPreferences, day: str) -> str:
+    lines = [f"Create a meal plan for {day} with breakfast, lunch and dinner."]
+    lines += _preference_lines(preferences)
+    times = preferences.time_availability.get(day)
+    if times:
+        lines.append(f"Max prep minutes (breakfast/lunch/dinner): {_prep_minutes(times)}")
+    lines.append(PLAN_RULES)
+    lines.append('Reply with JSON only: {"breakfast":M,"lunch":M,"dinner":M} where M = ' + MEAL_SCHEMA)
+    return "\n".join(lines)
+
+def build_meal_prompt(preferences: UserPreferences, day: str, meal: str, targets: Dict[str, float]) -> str:
+    lines = [f"Create a {meal} for {day}; the rest of the day is already planned."]
+    lines += _preference_lines(preferences)
+    meal_parts = [f"{round(targets[field])}{unit}" for field, unit in (("calories", " kcal"), ("protein", "g protein"))
+                  if targets.get(field)]
+    if meal_parts:
+        lines.append("This meal should provide about " + ", ".join(meal_parts))
+    max_minutes = preferences.time_availability.get(day, {}).get(meal)
+    if max_minutes:
+        lines.append(f"Max prep minutes: {max_minutes}")
+    lines.append(PLAN_RULES)
+    lines.append("Reply with JSON only: M where M = " + MEAL_SCHEMA)
+    return "\n".join(lines)
+
+def completion_params(messages: List[Dict[str, str]], days: int, meals: int = len(MEALS)) -> Dict[str, Any]:
+    """Request parameters with ``max_tokens`` sized for ``days`` days of ``meals`` meals."""
+    prompt_tokens = count_message_tokens(messages, MODEL)
+    return {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": completion_budget(days, meals, prompt_tokens),
+    }
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """Parse the JSON object in a completion, ignoring any surrounding prose or code fence."""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in completion")
+    return json.loads(text[start:end + 1])
+
+def check_daily_targets(day_plan: Dict[str, Any], targets: Dict[str, Any]) -> List[str]:
+    """Return a description of each daily target the day misses by more than the tolerance."""
+    issues = []
+    for field in ("calories", "protein"):
+        target = float(targets.get(field) or 0)
+        if not target:
+            continue
+        total = sum(float(meal.get(field) or 0) for meal in day_plan.values() if isinstance(meal, dict))
+        if abs(total - target) > target * MEAL_PLAN_TARGET_TOLERANCE:
+            issues.append(f"{field} {total:.0f} vs target {target:.0f}")
+    return issues
+
+async def generate_day_plan(preferences: UserPreferences, day: str) -> Dict[str, Any]:
+    content = await create_completion(
+        meals=len(MEALS),
+        **completion_params(_messages(build_day_prompt(preferences, day)), 1)
+    )
+    # ValidationError is a ValueError, so callers retry it like a parse failure
+    return DayPlan.model_validate(extract_json(content)).model_dump()
+
+async def generate_meal(preferences: UserPreferences, day: str, meal: str, targets: Dict[str, float]) -> Dict[str, Any]:
+    """One meal for a slot the recipe library could not fill, aimed at what the day still needs."""
+    content = await create_completion(
+        meals=1,
+        **completion_params(_messages(build_meal_prompt(preferences, day, meal, targets)), 1, meals=1)
+    )
+    return PlannedMeal.model_validate(extract_json(content)).model_dump()
+
+def plan_days(preferences: UserPreferences) -> List[str]:
+    return [day for day in WEEK_DAYS if day in preferences.time_availability] or WEEK_DAYS
+
+async def repair_meal_plan(preferences: UserPreferences, content: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Parse a weekly completion, regenerating only the days it is missing.
+
+    A completion cut off at ``max_tokens`` keeps its finished days; each
+    missing or invalid day costs one small per-day completion instead of a
+    whole new week. Returns the plan and the days that were regenerated.
+    """
+    plan, missing = parse_meal_plan(content, plan_days(preferences))
+    if missing:
+        logger.warning("Meal plan completion is missing %s; regenerating those days", ", ".join(missing))
+        day_plans = await asyncio.gather(*(generate_day_plan(preferences, day) for day in missing))
+        plan["weeklyPlan"].update(zip(missing, day_plans))
+        plan["weeklyPlan"] = {day: plan["weeklyPlan"][day] for day in plan_days(preferences)}
+    return plan, missing
+
+async def generate_meal_plan_by_day(
+    preferences: UserPreferences,
+    concurrency: int = MEAL_PLAN_DAY_CONCURRENCY
+) -> str:
+    """Generate each day with its own completion, concurrently, and merge into ``weeklyPlan``.
+
+    Returns the same JSON text as ``generate_meal_plan``. A day that fails to
+    parse or misses its targets is regenerated up to ``MEAL_PLAN_DAY_RETRIES``
+    times; a day that still misses its targets is kept and logged.
+    """
+    days = plan_days(preferences)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate_day(day: str) -> Dict[str, Any]:
+        for attempt in range(MEAL_PLAN_DAY_RETRIES + 1):
+            last_attempt = attempt == MEAL_PLAN_DAY_RETRIES
+            async with semaphore:
+                try:
+                    day_plan = await generate_day_plan(preferences, day)
+                except ValueError:
+                    if last_attempt:
+                        raise
+                    continue
+            issues = check_daily_targets(day_plan, preferences.targets)
+            if not issues or last_attempt:
+                if issues:
+                    logger.warning("Meal plan for %s misses targets: %s", day, "; ".join(issues))
+                return day_plan
+
+    try:
+        day_plans = await asyncio.gather(*(generate_day(day) for day in days))
+        return json.dumps({"weeklyPlan": dict(zip(days, day_plans))})
 
     except Exception as e:
-        print(f"Error generating meal plan: {str(e)}")
-        raise
\ No newline at end of file
+        logger.exception("Error generating meal plan: %s", e)
+        raise
+
+def get_meal_plan_generator():
+    """The generation function selected by ``MEAL_PLAN_GENERATION_MODE``."""
+    if MEAL_PLAN_GENERATION_MODE == 'per_day':
+        return generate_meal_plan_by_day
+    return generate_meal_plan
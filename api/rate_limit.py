@@ -0,0 +1,270 @@
+"""Admission control for the LLM-backed endpoints.
+
+Every request to a generation endpoint spends a token from the caller's
+bucket (``LLM_RATE_LIMIT_BURST`` tokens, refilled at
+``LLM_RATE_LIMIT_PER_MINUTE``). Synchronous generations additionally need
+one of ``LLM_MAX_CONCURRENT_REQUESTS`` slots, held until the response has
+been fully sent. When either is exhausted the request is shed immediately
+with 429 and ``Retry-After`` instead of queueing into a timeout.
+
+Buckets and slots live in memory by default, which makes the slot cap per
+worker process. ``RATE_LIMIT_BACKEND=sqlite`` keeps both in a SQLite file
+shared by every worker on the host, standing in for a shared store such as
+Redis, so the cap holds for the host as a whole. A slot there expires after
+``LLM_SLOT_TTL_SECONDS`` in case its worker dies without releasing it.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from auth import ALGORITHM, SECRET_KEY
+
+LLM_RATE_LIMIT_PER_MINUTE = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "2"))
+LLM_RATE_LIMIT_BURST = float(os.getenv("LLM_RATE_LIMIT_BURST", "3"))
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "16"))
+# Longer than any generation (gunicorn's WORKER_TIMEOUT is 120s)
+LLM_SLOT_TTL_SECONDS = float(os.getenv("LLM_SLOT_TTL_SECONDS", "600"))
+LLM_SATURATED_RETRY_AFTER_SECONDS = int(os.getenv("LLM_SATURATED_RETRY_AFTER_SECONDS", "10"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "./rate_limit.db")
+
+# (method, path) -> whether the request also holds a concurrency slot
+LLM_ENDPOINTS = {
+    ("POST", "/api/meal-plan/generate"): True,
+    ("POST", "/api/meal-plan/generate/stream"): True,
+    ("POST", "/api/meal-plan/jobs"): False,
+}
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, rate: float) -> float:
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _take(tokens: float, capacity: float, rate: float) -> Tuple[bool, float, float]:
+    """Spend one token; returns ``(allowed, tokens left, seconds until a token is free)``."""
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate if rate > 0 else float(LLM_SATURATED_RETRY_AFTER_SECONDS)
+
+
+class MemoryRateLimitBackend:
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._slots = 0
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            allowed, tokens, retry_after = _take(_refill(tokens, updated, now, capacity, rate), capacity, rate)
+            self._buckets[key] = (tokens, now)
+        return allowed, retry_after
+
+    async def acquire_slot(self, limit: int) -> Optional[str]:
+        """A concurrency slot to hand back to ``release_slot``, or None when all ``limit`` are taken."""
+        with self._lock:
+            if self._slots >= limit:
+                return None
+            self._slots += 1
+        return "memory"
+
+    async def release_slot(self, slot: str):
+        with self._lock:
+            self._slots -= 1
+
+
+class SQLiteRateLimitBackend:
+    """Buckets and concurrency slots shared across worker processes through one SQLite file."""
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, slot_ttl: float = LLM_SLOT_TTL_SECONDS):
+        self.path = path
+        self.slot_ttl = slot_ttl
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_slots (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def _take(self, key: str, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so concurrent workers serialize
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            allowed, tokens, retry_after = _take(_refill(tokens, updated, now, capacity, rate), capacity, rate)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return allowed, retry_after
+
+    def _acquire_slot(self, limit: int) -> Optional[str]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM llm_slots WHERE expires_at < ?", (now,))
+            (in_use,) = conn.execute("SELECT count(*) FROM llm_slots").fetchone()
+            slot = None
+            if in_use < limit:
+                slot = uuid.uuid4().hex
+                conn.execute("INSERT INTO llm_slots (id, expires_at) VALUES (?, ?)", (slot, now + self.slot_ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return slot
+
+    def _release_slot(self, slot: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM llm_slots WHERE id = ?", (slot,))
+        finally:
+            conn.close()
+
+    async def take(self, key: str, capacity: float, rate: float) -> Tuple[bool, float]:
+        return await run_in_threadpool(self._take, key, capacity, rate)
+
+    async def acquire_slot(self, limit: int) -> Optional[str]:
+        return await run_in_threadpool(self._acquire_slot, limit)
+
+    async def release_slot(self, slot: str):
+        await run_in_threadpool(self._release_slot, slot)
+
+
+RATE_LIMIT_BACKENDS = {
+    "memory": MemoryRateLimitBackend,
+    "sqlite": SQLiteRateLimitBackend,
+}
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rate_limited = 0
+        self.saturated = 0
+        # This worker's share; the cap itself is enforced by the backend
+        self.in_flight = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "saturated": self.saturated,
+            "in_flight": self.in_flight,
+        }
+
+
+admission_stats = AdmissionStats()
+
+
+def client_key(scope: Scope) -> str:
+    """The token subject when the bearer token decodes, else the client address."""
+    authorization = Headers(scope=scope).get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            if user_id:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionControlMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        backend=None,
+        rate_per_minute: float = LLM_RATE_LIMIT_PER_MINUTE,
+        burst: float = LLM_RATE_LIMIT_BURST,
+        max_concurrent: int = LLM_MAX_CONCURRENT_REQUESTS,
+    ):
+        self.app = app
+        self.backend = backend or RATE_LIMIT_BACKENDS[RATE_LIMIT_BACKEND]()
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        holds_slot = None
+        if scope["type"] == "http":
+            holds_slot = LLM_ENDPOINTS.get((scope["method"], scope["path"].rstrip("/")))
+        if holds_slot is None:
+            await self.app(scope, receive, send)
+            return
+        # Rejected requests never reach the router; label their metrics by endpoint
+        scope["route_path"] = scope["path"].rstrip("/")
+
+        # The slot is taken before the token, so a saturated system does not
+        # also drain the caller's bucket
+        slot = None
+        if holds_slot:
+            slot = await self.backend.acquire_slot(self.max_concurrent)
+            if slot is None:
+                admission_stats.saturated += 1
+                await self._reject(send, "Meal plan generation is at capacity, please retry shortly",
+                                   LLM_SATURATED_RETRY_AFTER_SECONDS)
+                return
+
+        allowed, retry_after = await self.backend.take(client_key(scope), self.burst, self.rate)
+        if not allowed:
+            if slot is not None:
+                await self.backend.release_slot(slot)
+            admission_stats.rate_limited += 1
+            await self._reject(send, "Too many meal plan requests", retry_after)
+            return
+
+        admission_stats.admitted += 1
+        if slot is None:
+            await self.app(scope, receive, send)
+            return
+        admission_stats.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_stats.in_flight -= 1
+            await self.backend.release_slot(slot)
+
+    @staticmethod
+    async def _reject(send: Send, detail: str, retry_after: Optional[float]):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after or 0))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,428 @@
+"""Recipe library: generated meals harvested into ``Recipe`` rows, searchable in memory.
+
+Rows live in the SQL database, read and written through the async engine of
+``database.py``. Every worker loads them into a ``RecipeIndex`` on first use
+and keeps it current as it writes recipes itself:
+
+* inverted indexes from tag, dosha and dietary restriction to recipe ids
+* range indexes (sorted ``(value, id)`` arrays searched with ``bisect``) on
+  prep minutes, calories, protein, carbs and fat
+
+A search intersects the matching id sets, smallest first, so filling a plan
+slot from the library takes microseconds instead of a completion.
+
+Meals are harvested after every generated plan, deduplicated by name. They
+are tagged with their meal type plus the dietary restrictions and cuisines
+they were generated for, and their doshas are read from the ``ayurvedic``
+note.
+
+With several workers the index is eventually consistent: recipes another
+worker harvests, edits or deletes show up after the next full reload, every
+``RECIPE_LIBRARY_REFRESH_SECONDS`` (0 disables it). Names stay unique across
+workers regardless, through the ``ux_recipe_name`` index on the table: a
+harvest skips names that are already stored, and creating or renaming a
+recipe to a taken name raises ``DuplicateRecipeError``.
+
+Every user's plans are built from this one library, so only the user who
+created a recipe may change or delete it (``owner_id``). Harvested recipes
+have no owner and are read-only; writing one raises ``ReadOnlyRecipeError``.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+from sqlmodel import select
+
+from database import async_session, create_db_and_tables_async, init_async_engine
+from models import RECIPE_NAME_INDEX, Recipe, UserPreferences
+
+logger = logging.getLogger(__name__)
+
+RECIPE_LIBRARY_HARVEST = os.getenv("RECIPE_LIBRARY_HARVEST", "true").lower() == "true"
+RECIPE_LIBRARY_REFRESH_SECONDS = float(os.getenv("RECIPE_LIBRARY_REFRESH_SECONDS", "300"))
+
+MEAL_TYPES = ("breakfast", "lunch", "dinner")
+DOSHAS = ("vata", "pitta", "kapha")
+# The dietary restrictions offered by the preferences form, normalized
+RESTRICTIONS = (
+    "vegetarian", "vegan", "no-eggs", "gluten-free", "dairy-free",
+    "low-carb", "no-nuts", "no-soy", "low-fodmap",
+)
+RANGE_FIELDS = ("prep_minutes", "calories", "protein", "carbs", "fat")
+
+
+class DuplicateRecipeError(ValueError):
+    """Another recipe already has this name."""
+
+
+class ReadOnlyRecipeError(PermissionError):
+    """The recipe was harvested or belongs to another user."""
+
+
+def is_duplicate_name(error: IntegrityError) -> bool:
+    return RECIPE_NAME_INDEX.name in str(error.orig)
+
+
+def normalize_tag(value: str) -> str:
+    return re.sub(r"[\s_]+", "-", value.strip().lower())
+
+
+def parse_minutes(prep_time: str) -> Optional[int]:
+    """Minutes in a prep time such as ``"25 mins"``, ``"1 hr 10 min"`` or ``"30"``."""
+    text = (prep_time or "").lower()
+    hours = re.search(r"(\d+(?:\.\d+)?)\s*h", text)
+    minutes = re.search(r"(\d+)\s*m", text)
+    if hours or minutes:
+        return round(float(hours.group(1)) * 60 if hours else 0) + (int(minutes.group(1)) if minutes else 0)
+    bare = re.search(r"\d+", text)
+    return int(bare.group()) if bare else None
+
+
+def doshas_in(text: str) -> List[str]:
+    text = (text or "").lower()
+    return [dosha for dosha in DOSHAS if dosha in text]
+
+
+def difficulty_for(minutes: Optional[int]) -> str:
+    if minutes is None or minutes <= 20:
+        return "easy"
+    return "medium" if minutes <= 45 else "hard"
+
+
+def recipe_to_dict(recipe: Recipe) -> Dict[str, Any]:
+    """``RecipeRead``-shaped response for a row."""
+    return {
+        "id": recipe.id,
+        "name": recipe.name,
+        "image": recipe.image,
+        "prep_time": recipe.prep_time,
+        "servings": recipe.servings,
+        "difficulty": recipe.difficulty,
+        "ayurvedic": recipe.ayurvedic,
+        "tags": recipe.tags,
+        "ingredients": recipe.ingredients,
+        "instructions": recipe.instructions,
+        "calories": recipe.calories,
+        "protein": recipe.protein,
+        "carbs": recipe.carbs,
+        "fat": recipe.fat,
+        "created_at": recipe.created_at,
+        "user_id": recipe.user_id,
+    }
+
+
+def meal_to_recipe_data(meal_type: str, meal: Dict[str, Any], preferences: UserPreferences) -> Dict[str, Any]:
+    minutes = parse_minutes(meal.get("prepTime", ""))
+    tags = [meal_type]
+    tags += [normalize_tag(restriction) for restriction in preferences.dietary_restrictions or []]
+    tags += [normalize_tag(cuisine) for cuisine in preferences.cultural_background or []]
+    return {
+        "name": meal["recipe"],
+        "image": meal.get("image", ""),
+        "prep_time": meal.get("prepTime", ""),
+        "servings": 1,
+        "difficulty": difficulty_for(minutes),
+        "ayurvedic": meal.get("ayurvedic", ""),
+        "tags": list(dict.fromkeys(tags)),
+        "ingredients": meal.get("ingredients", []),
+        "instructions": meal.get("instructions", []),
+        "calories": round(float(meal.get("calories") or 0)),
+        "protein": round(float(meal.get("protein") or 0)),
+        "carbs": round(float(meal.get("carbs") or 0)),
+        "fat": round(float(meal.get("fat") or 0)),
+    }
+
+
+class RangeIndex:
+    """Recipe ids ordered by one numeric attribute."""
+
+    def __init__(self):
+        self._values: List[float] = []
+        self._ids: List[int] = []
+
+    def add(self, value: float, recipe_id: int):
+        position = bisect.bisect_right(self._values, value)
+        self._values.insert(position, value)
+        self._ids.insert(position, recipe_id)
+
+    def remove(self, value: float, recipe_id: int):
+        start = bisect.bisect_left(self._values, value)
+        end = bisect.bisect_right(self._values, value)
+        for position in range(start, end):
+            if self._ids[position] == recipe_id:
+                del self._values[position]
+                del self._ids[position]
+                return
+
+    def between(self, low: Optional[float] = None, high: Optional[float] = None) -> Set[int]:
+        start = bisect.bisect_left(self._values, low) if low is not None else 0
+        end = bisect.bisect_right(self._values, high) if high is not None else len(self._values)
+        return set(self._ids[start:end])
+
+
+class RecipeIndex:
+    def __init__(self):
+        self.recipes: Dict[int, Dict[str, Any]] = {}
+        self.by_name: Dict[str, int] = {}
+        self.by_tag: Dict[str, Set[int]] = defaultdict(set)
+        self.by_dosha: Dict[str, Set[int]] = defaultdict(set)
+        self.by_restriction: Dict[str, Set[int]] = defaultdict(set)
+        self.ranges = {field: RangeIndex() for field in RANGE_FIELDS}
+        # id -> values the recipe was indexed under, so it can be removed again
+        self._keys: Dict[int, Tuple[List[str], List[str], Dict[str, float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def add(self, recipe: Dict[str, Any]):
+        recipe_id = recipe["id"]
+        if recipe_id in self.recipes:
+            self.remove(recipe_id)
+        tags = [normalize_tag(tag) for tag in recipe["tags"]]
+        doshas = doshas_in(recipe["ayurvedic"])
+        minutes = parse_minutes(recipe["prep_time"])
+        values = {field: recipe[field] for field in RANGE_FIELDS if field != "prep_minutes"}
+        if minutes is not None:
+            values["prep_minutes"] = minutes
+
+        self.recipes[recipe_id] = recipe
+        self.by_name[recipe["name"].strip().lower()] = recipe_id
+        for tag in tags:
+            self.by_tag[tag].add(recipe_id)
+            if tag in RESTRICTIONS:
+                self.by_restriction[tag].add(recipe_id)
+        for dosha in doshas:
+            self.by_dosha[dosha].add(recipe_id)
+        for field, value in values.items():
+            self.ranges[field].add(value, recipe_id)
+        self._keys[recipe_id] = (tags, doshas, values)
+
+    def remove(self, recipe_id: int):
+        recipe = self.recipes.pop(recipe_id, None)
+        if recipe is None:
+            return
+        self.by_name.pop(recipe["name"].strip().lower(), None)
+        tags, doshas, values = self._keys.pop(recipe_id)
+        for tag in tags:
+            self.by_tag[tag].discard(recipe_id)
+            self.by_restriction.get(tag, set()).discard(recipe_id)
+        for dosha in doshas:
+            self.by_dosha[dosha].discard(recipe_id)
+        for field, value in values.items():
+            self.ranges[field].remove(value, recipe_id)
+
+    def prep_minutes(self, recipe_id: int) -> Optional[float]:
+        return self._keys[recipe_id][2].get("prep_minutes")
+
+    def has_name(self, name: str) -> bool:
+        return name.strip().lower() in self.by_name
+
+    def search(
+        self,
+        tags: Iterable[str] = (),
+        doshas: Iterable[str] = (),
+        restrictions: Iterable[str] = (),
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        text: Optional[str] = None,
+    ) -> List[int]:
+        """Ids matching every tag and restriction, any of ``doshas`` and all ranges, in id order."""
+        candidates: List[Set[int]] = []
+        for tag in tags:
+            candidates.append(self.by_tag.get(normalize_tag(tag), set()))
+        for restriction in restrictions:
+            candidates.append(self.by_restriction.get(normalize_tag(restriction), set()))
+        doshas = [dosha.lower() for dosha in doshas]
+        if doshas:
+            candidates.append(set().union(*(self.by_dosha.get(dosha, set()) for dosha in doshas)))
+        for field, (low, high) in (ranges or {}).items():
+            if low is not None or high is not None:
+                candidates.append(self.ranges[field].between(low, high))
+
+        if candidates:
+            candidates.sort(key=len)
+            ids = set(candidates[0])
+            for other in candidates[1:]:
+                ids &= other
+                if not ids:
+                    break
+        else:
+            ids = set(self.recipes)
+        if text:
+            needle = text.strip().lower()
+            ids = {recipe_id for recipe_id in ids if needle in self.recipes[recipe_id]["name"].lower()}
+        return sorted(ids)
+
+
+class RecipeLibrary:
+    def __init__(self):
+        self.index = RecipeIndex()
+        self.harvested = 0
+        self._loaded_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+
+    async def _create_table(self):
+        await create_db_and_tables_async(Recipe)
+        async with init_async_engine().begin() as conn:
+            columns = await conn.run_sync(
+                lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns(Recipe.__tablename__)}
+            )
+            # Tables created before recipes had owners; their rows stay read-only
+            if "owner_id" not in columns:
+                await conn.execute(text(f'ALTER TABLE "{Recipe.__tablename__}" ADD COLUMN owner_id VARCHAR'))
+        # Tables created before the unique name index existed don't have it yet
+        try:
+            async with init_async_engine().begin() as conn:
+                await conn.execute(CreateIndex(RECIPE_NAME_INDEX, if_not_exists=True))
+        except IntegrityError:
+            logger.warning("Recipe names are not unique; run migrate_json_columns.py to deduplicate them")
+
+    async def _load_rows(self) -> List[Dict[str, Any]]:
+        if self._loaded_at is None:
+            await self._create_table()
+        async with async_session() as session:
+            return [recipe_to_dict(recipe) for recipe in await session.exec(select(Recipe))]
+
+    def _stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return RECIPE_LIBRARY_REFRESH_SECONDS > 0 and time.monotonic() - self._loaded_at >= RECIPE_LIBRARY_REFRESH_SECONDS
+
+    async def ensure_loaded(self):
+        """Load the index on first use, and reload it once it is older than the refresh interval."""
+        if not self._stale():
+            return
+        async with self._load_lock:
+            if self._stale():
+                index = RecipeIndex()
+                for recipe in await self._load_rows():
+                    index.add(recipe)
+                # Swapped in whole, so a search never sees a half-built index
+                self.index = index
+                self._loaded_at = time.monotonic()
+
+    async def _insert(self, rows: List[Dict[str, Any]], skip_duplicates: bool = False) -> List[Dict[str, Any]]:
+        """Insert ``rows`` and return the stored recipes.
+
+        With ``skip_duplicates`` rows whose name is taken, possibly by another
+        worker a moment ago, are left out of the result; otherwise they raise
+        ``DuplicateRecipeError``.
+        """
+        async with async_session() as session:
+            insert = postgresql_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+            statement = insert(Recipe).values([Recipe(**row).model_dump(exclude={"id"}) for row in rows])
+            if skip_duplicates:
+                statement = statement.on_conflict_do_nothing()
+            try:
+                result = await session.execute(statement.returning(*Recipe.__table__.columns))
+                recipes = [recipe_to_dict(Recipe(**row)) for row in result.mappings()]
+                await session.commit()
+            except IntegrityError as e:
+                if not is_duplicate_name(e):
+                    raise
+                raise DuplicateRecipeError("A recipe with this name already exists") from e
+            return recipes
+
+    async def _update(self, recipe_id: int, fields: Dict[str, Any], owner_id: str) -> Optional[Dict[str, Any]]:
+        async with async_session() as session:
+            recipe = await session.get(Recipe, recipe_id)
+            if recipe is None:
+                return None
+            if recipe.owner_id != owner_id:
+                raise ReadOnlyRecipeError("Only the user who created a recipe can change it")
+            for key, value in fields.items():
+                setattr(recipe, key, value)
+            try:
+                await session.commit()
+            except IntegrityError as e:
+                if not is_duplicate_name(e):
+                    raise
+                raise DuplicateRecipeError("A recipe with this name already exists") from e
+            return recipe_to_dict(recipe)
+
+    async def _delete(self, recipe_id: int, owner_id: str) -> bool:
+        async with async_session() as session:
+            recipe = await session.get(Recipe, recipe_id)
+            if recipe is None:
+                return False
+            if recipe.owner_id != owner_id:
+                raise ReadOnlyRecipeError("Only the user who created a recipe can delete it")
+            await session.delete(recipe)
+            await session.commit()
+            return True
+
+    def get(self, recipe_id: int) -> Optional[Dict[str, Any]]:
+        return self.index.recipes.get(recipe_id)
+
+    async def create(self, data: Dict[str, Any], owner_id: str) -> Dict[str, Any]:
+        """Store a new recipe owned by ``owner_id``; raises ``DuplicateRecipeError`` if its name is taken."""
+        await self.ensure_loaded()
+        [recipe] = await self._insert([data | {"owner_id": owner_id}])
+        self.index.add(recipe)
+        return recipe
+
+    async def update(self, recipe_id: int, fields: Dict[str, Any], owner_id: str) -> Optional[Dict[str, Any]]:
+        """Write ``fields``, already validated by ``RecipeUpdate``, and reindex the recipe.
+
+        Raises ``ReadOnlyRecipeError`` unless ``owner_id`` created the recipe,
+        and ``DuplicateRecipeError`` when renamed to a name that is taken.
+        """
+        await self.ensure_loaded()
+        recipe = await self._update(recipe_id, fields, owner_id)
+        if recipe is not None:
+            self.index.add(recipe)
+        return recipe
+
+    async def delete(self, recipe_id: int, owner_id: str) -> bool:
+        """Raises ``ReadOnlyRecipeError`` unless ``owner_id`` created the recipe."""
+        await self.ensure_loaded()
+        deleted = await self._delete(recipe_id, owner_id)
+        self.index.remove(recipe_id)
+        return deleted
+
+    async def search(self, offset: int = 0, limit: int = 20, **filters) -> Tuple[int, List[Dict[str, Any]]]:
+        """``(total matches, one page of recipes)``."""
+        await self.ensure_loaded()
+        ids = self.index.search(**filters)
+        return len(ids), [self.index.recipes[recipe_id] for recipe_id in ids[offset:offset + limit]]
+
+    async def harvest(self, plan: Dict[str, Any], preferences: UserPreferences) -> int:
+        """Add the plan's meals that are not in the library yet; returns how many were added."""
+        if not RECIPE_LIBRARY_HARVEST:
+            return 0
+        try:
+            await self.ensure_loaded()
+            rows = {}
+            for meals in plan.get("weeklyPlan", {}).values():
+                for meal_type, meal in meals.items():
+                    if meal_type not in MEAL_TYPES or not isinstance(meal, dict) or not meal.get("recipe"):
+                        continue
+                    key = meal["recipe"].strip().lower()
+                    if key not in rows and not self.index.has_name(key):
+                        rows[key] = meal_to_recipe_data(meal_type, meal, preferences)
+            if not rows:
+                return 0
+            added = await self._insert(list(rows.values()), skip_duplicates=True)
+            for recipe in added:
+                self.index.add(recipe)
+            self.harvested += len(added)
+            return len(added)
+        except Exception as e:
+            # The plan is already saved; a failed harvest only costs future library hits
+            logger.exception("Recipe harvest failed: %s", e)
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"recipes": len(self.index), "harvested": self.harvested}
+
+
+recipe_library = RecipeLibrary()
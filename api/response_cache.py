@@ -0,0 +1,143 @@
+"""Per-user cache of serialized read responses with strong ETags.
+
+Read endpoints keep the JSON body of each user's resources (``user``,
+``preferences``, ``mealPlan``, ``shoppingList``) together with a SHA-256
+ETag. A repeat read is answered from memory, and a request whose
+``If-None-Match`` matches gets a bodiless 304. Every ``storage`` write
+(Firestore or SQL) invalidates the affected resource.
+
+The cache is per process and so is the invalidation: a worker would keep
+serving a body another worker has since changed. With more than one worker
+(``WEB_CONCURRENCY``, which ``gunicorn.conf.py`` exports) bodies are
+therefore not kept unless ``RESPONSE_CACHE_TTL_SECONDS`` is set. Every read
+then goes to storage, and the ETag and 304 still spare the transfer.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30" if WORKERS <= 1 else "0"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison, as for ``If-None-Match``: a compressed response's ``W/`` tag matches too."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, bytes, float]]" = OrderedDict()
+        # Every invalidation stamps its key from one clock, so a read that
+        # raced a write is not cached. The stamps are bounded like the
+        # entries; one pushed out raises the floor that unstamped keys read
+        # as, so a read it raced is still refused.
+        self._clock = 0
+        self._floor = 0
+        self._generations: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: str, resource: str) -> int:
+        with self._lock:
+            return self._generations.get((user_id, resource), self._floor)
+
+    def get(self, user_id: str, resource: str) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entry = self._entries.get((user_id, resource))
+            if entry is None or entry[2] <= time.time():
+                self._entries.pop((user_id, resource), None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, resource))
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, user_id: str, resource: str, etag: str, body: bytes, generation: int):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if self._generations.get((user_id, resource), self._floor) != generation:
+                return
+            self._entries[(user_id, resource)] = (etag, body, time.time() + self.ttl)
+            self._entries.move_to_end((user_id, resource))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str, *resources: str):
+        with self._lock:
+            for resource in resources:
+                self._entries.pop((user_id, resource), None)
+                self._clock += 1
+                self._generations[(user_id, resource)] = self._clock
+                self._generations.move_to_end((user_id, resource))
+            while len(self._generations) > self.max_entries:
+                _, stamp = self._generations.popitem(last=False)
+                self._floor = max(self._floor, stamp)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+response_cache = ResponseCache()
+
+
+def serialize(data: Any) -> bytes:
+    # orjson handles dicts, lists and datetimes natively; anything else goes through FastAPI
+    return orjson.dumps(data, default=jsonable_encoder)
+
+
+async def cached_response(
+    request: Request,
+    user_id: str,
+    resource: str,
+    loader: Callable[[], Awaitable[Any]],
+) -> Optional[Response]:
+    """Serve ``resource`` from the cache or ``loader``; ``None`` when the loader finds nothing."""
+    cached = response_cache.get(user_id, resource)
+    if cached is None:
+        generation = response_cache.generation(user_id, resource)
+        data = await loader()
+        if data is None:
+            return None
+        body = serialize(data)
+        etag = compute_etag(body)
+        response_cache.set(user_id, resource, etag, body, generation)
+    else:
+        etag, body = cached
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        response_cache.not_modified += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
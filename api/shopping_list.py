@@ -0,0 +1,182 @@
+"""Derive the shopping list from the saved meal plan.
+
+Each ingredient string from ``weeklyPlan`` is parsed into a normalized
+``(name, quantity, unit)`` record and duplicates are summed across the week.
+Derived items are stored in ``shoppingList`` with ``source: "mealPlan"``, a
+deterministic document id per ``(name, unit)`` and a per-day breakdown in
+``contributions``, so re-deriving a single day only rewrites the items that
+day touches and leaves the user's ``checked`` flags alone.
+"""
+import re
+from datetime import datetime
+from fractions import Fraction
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import storage
+
+SOURCE = "mealPlan"
+
+UNICODE_FRACTIONS = {"½": "1/2", "¼": "1/4", "¾": "3/4", "⅓": "1/3", "⅔": "2/3", "⅛": "1/8"}
+
+# alias -> (canonical unit, factor to the canonical unit)
+UNITS = {
+    "g": ("g", 1), "gram": ("g", 1), "grams": ("g", 1), "gr": ("g", 1),
+    "kg": ("g", 1000), "kilogram": ("g", 1000), "kilograms": ("g", 1000),
+    "mg": ("g", 0.001),
+    "ml": ("ml", 1), "milliliter": ("ml", 1), "milliliters": ("ml", 1),
+    "l": ("ml", 1000), "liter": ("ml", 1000), "liters": ("ml", 1000), "litre": ("ml", 1000),
+    "tsp": ("tsp", 1), "teaspoon": ("tsp", 1), "teaspoons": ("tsp", 1),
+    "tbsp": ("tsp", 3), "tablespoon": ("tsp", 3), "tablespoons": ("tsp", 3), "tbs": ("tsp", 3),
+    "cup": ("cup", 1), "cups": ("cup", 1),
+    "oz": ("oz", 1), "ounce": ("oz", 1), "ounces": ("oz", 1),
+    "lb": ("oz", 16), "lbs": ("oz", 16), "pound": ("oz", 16), "pounds": ("oz", 16),
+    "clove": ("clove", 1), "cloves": ("clove", 1),
+    "pinch": ("pinch", 1), "pinches": ("pinch", 1),
+    "can": ("can", 1), "cans": ("can", 1),
+    "bunch": ("bunch", 1), "bunches": ("bunch", 1),
+    "slice": ("slice", 1), "slices": ("slice", 1),
+    "piece": ("piece", 1), "pieces": ("piece", 1), "pc": ("piece", 1), "pcs": ("piece", 1),
+    # Sizes, as in "1 inch ginger"; "in" is left out, it is too often a plain word
+    "inch": ("inch", 1), "inches": ("inch", 1),
+    "cm": ("cm", 1), "centimeter": ("cm", 1), "centimeters": ("cm", 1), "centimetre": ("cm", 1),
+    "centimetres": ("cm", 1),
+    "handful": ("handful", 1), "handfuls": ("handful", 1),
+}
+
+_QUANTITY = re.compile(r"^\s*(\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)(?:\s*-\s*[\d./]+)?")
+# The hyphen covers "1-inch ginger"
+_WORD = re.compile(r"^\s*-?([a-zA-Z]+)\.?(?=\s|$|\d)")
+
+
+def _to_number(text: str) -> float:
+    parts = text.split()
+    return float(sum(Fraction(part) for part in parts))
+
+
+def parse_ingredient(text: str) -> Dict[str, Any]:
+    """Split e.g. ``"1 1/2 cups cooked basmati rice, rinsed"`` into name, quantity and unit."""
+    raw = text
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        text = text.replace(symbol, f" {fraction}")
+    text = re.sub(r"\([^)]*\)", " ", text)
+
+    quantity: Optional[float] = None
+    match = _QUANTITY.match(text)
+    if match:
+        quantity = _to_number(match.group(1))
+        text = text[match.end():]
+
+    unit: Optional[str] = None
+    # "200g paneer" carries the unit glued to the number
+    match = _WORD.match(text)
+    if match and match.group(1).lower() in UNITS:
+        unit, factor = UNITS[match.group(1).lower()]
+        if quantity is not None:
+            quantity *= factor
+        text = text[match.end():]
+
+    name = text.split(",")[0].strip().lower()
+    if unit in ("inch", "cm"):
+        # "1-inch piece of ginger"
+        name = re.sub(r"^pieces?\b", "", name).strip()
+    name = re.sub(r"^of\s+", "", name)
+    name = re.sub(r"\s+", " ", name).strip(" .;:-")
+    return {"name": name or raw.strip().lower(), "quantity": quantity, "unit": unit}
+
+
+def item_id(name: str, unit: Optional[str]) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", name).strip("-")
+    return f"mealplan-{slug}-{unit or 'each'}"
+
+
+def aggregate_ingredients(ingredients: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Sum parsed ingredients that share a name and unit, keyed by ``item_id``."""
+    totals: Dict[str, Dict[str, Any]] = {}
+    for ingredient in ingredients:
+        if not isinstance(ingredient, str) or not ingredient.strip():
+            continue
+        parsed = parse_ingredient(ingredient)
+        key = item_id(parsed["name"], parsed["unit"])
+        if key not in totals:
+            totals[key] = parsed
+        elif parsed["quantity"] is not None:
+            current = totals[key]["quantity"] or 0
+            totals[key]["quantity"] = current + parsed["quantity"]
+    return totals
+
+
+def aggregate_day(day_plan: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    ingredients: List[str] = []
+    for meal in day_plan.values():
+        if isinstance(meal, dict):
+            ingredients.extend(meal.get("ingredients") or [])
+    return aggregate_ingredients(ingredients)
+
+
+def _total(contributions: Dict[str, Optional[float]]) -> Optional[float]:
+    quantities = [q for q in contributions.values() if q is not None]
+    return round(sum(quantities), 3) if quantities else None
+
+
+def merge_day_contributions(
+    existing: Dict[str, Dict[str, Any]],
+    day_totals: Dict[str, Dict[str, Dict[str, Any]]],
+) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """Fold fresh per-day totals into the stored derived items.
+
+    ``existing`` maps item id to the stored document; ``day_totals`` maps each
+    re-derived day to its aggregated ingredients. Only items that gain or lose
+    a contribution from those days are returned, as ``(upserts, deletes)``.
+    """
+    now = datetime.utcnow()
+    days = set(day_totals)
+    touched = {key for key, doc in existing.items() if days & set(doc.get("contributions", {}))}
+    for totals in day_totals.values():
+        touched.update(totals)
+
+    upserts: Dict[str, Dict[str, Any]] = {}
+    deletes: List[str] = []
+    for key in touched:
+        doc = dict(existing.get(key) or {})
+        contributions = {
+            day: qty for day, qty in doc.get("contributions", {}).items() if day not in days
+        }
+        parsed = None
+        for day, totals in day_totals.items():
+            if key in totals:
+                parsed = totals[key]
+                contributions[day] = parsed["quantity"]
+        if not contributions:
+            deletes.append(key)
+            continue
+        if not doc:
+            doc = {
+                "name": parsed["name"],
+                "unit": parsed["unit"],
+                "checked": False,
+                "source": SOURCE,
+                "createdAt": now,
+            }
+        doc.update(contributions=contributions, quantity=_total(contributions), updatedAt=now)
+        doc.pop("id", None)
+        upserts[key] = doc
+    return upserts, deletes
+
+
+async def sync_shopping_list_from_plan(
+    user_id: str,
+    plan: Dict[str, Any],
+    days: Optional[List[str]] = None,
+) -> Dict[str, int]:
+    """Re-derive the meal-plan items for ``days`` (default: the whole week) in one batch."""
+    weekly_plan = plan.get("weeklyPlan", {})
+    existing = await storage.get_shopping_items_by_source(user_id, SOURCE)
+    if days is None:
+        # A full rebuild also drops days that are no longer in the plan
+        days = sorted(set(weekly_plan) | {
+            day for doc in existing.values() for day in doc.get("contributions", {})
+        })
+    day_totals = {day: aggregate_day(weekly_plan.get(day) or {}) for day in days}
+    upserts, deletes = merge_day_contributions(existing, day_totals)
+    await storage.write_shopping_items(user_id, upserts, deletes)
+    return {"updated": len(upserts), "deleted": len(deletes)}
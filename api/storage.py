@@ -0,0 +1,309 @@
+"""Storage for users, preferences, meal plans and shopping lists.
+
+``STORAGE_BACKEND`` selects where the endpoints keep their data:
+
+* ``firestore`` - ``FirestoreDB`` (the default)
+* ``sql``       - ``SQLStorage``: the same documents in SQL tables, through
+                  the async engine of ``database.py`` (aiosqlite locally,
+                  asyncpg on Cloud SQL)
+
+Both expose the same async static methods and return the same dicts, so the
+endpoints only ever use ``storage``.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, or_
+from sqlmodel import select
+
+from database import async_session, create_db_and_tables_async
+from firestore_db import TOMBSTONE_TTL, FirestoreDB, decode_cursor, init_firebase, paginate
+from metrics import instrument
+from models import MealPlanDocument, PreferencesDocument, ShoppingItemDocument, ShoppingItemTombstone, UserDocument
+from response_cache import response_cache
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+# Page size of GET /api/shopping-list when paging without a limit, and the largest limit
+SHOPPING_LIST_PAGE_SIZE = int(os.getenv("SHOPPING_LIST_PAGE_SIZE", "100"))
+SHOPPING_LIST_MAX_PAGE_SIZE = int(os.getenv("SHOPPING_LIST_MAX_PAGE_SIZE", "500"))
+
+SQL_TABLES = (UserDocument, PreferencesDocument, MealPlanDocument, ShoppingItemDocument, ShoppingItemTombstone)
+_tables_created = False
+_tables_lock = asyncio.Lock()
+
+
+async def create_sql_tables():
+    global _tables_created
+    async with _tables_lock:
+        if not _tables_created:
+            await create_db_and_tables_async(*SQL_TABLES)
+            _tables_created = True
+
+
+async def _session():
+    if not _tables_created:
+        # Requests can arrive before the warm-up has created the tables
+        await create_sql_tables()
+    return async_session()
+
+
+def _merge(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Like Firestore's ``set(..., merge=True)``: nested maps are merged, other values replaced."""
+    merged = dict(current)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _set_item(row: ShoppingItemDocument, item: Dict[str, Any]):
+    """Store ``item`` in ``row``, moving its timestamps to their columns."""
+    data = dict(item)
+    data.pop("id", None)
+    for field, column in (("createdAt", "created_at"), ("updatedAt", "updated_at")):
+        if isinstance(data.get(field), datetime):
+            setattr(row, column, data.pop(field))
+    row.data = data
+    row.source = data.get("source")
+    row.checked = data.get("checked")
+    row.category = data.get("category")
+
+
+def _item(row: ShoppingItemDocument) -> Dict[str, Any]:
+    item = dict(row.data)
+    if row.created_at is not None:
+        item["createdAt"] = row.created_at
+    if row.updated_at is not None:
+        item["updatedAt"] = row.updated_at
+    return item
+
+
+def _new_id() -> str:
+    # Same length as an auto-generated Firestore document id
+    return uuid.uuid4().hex[:20]
+
+
+def _items_query(user_id: str):
+    return select(ShoppingItemDocument).where(ShoppingItemDocument.user_id == user_id)
+
+
+async def _delete_items(session, user_id: str, item_ids: List[str]):
+    """Delete the items, record their tombstones and drop the user's expired ones."""
+    now = datetime.utcnow()
+    await session.exec(delete(ShoppingItemDocument).where(
+        ShoppingItemDocument.user_id == user_id, ShoppingItemDocument.id.in_(item_ids)
+    ))
+    await session.exec(delete(ShoppingItemTombstone).where(
+        ShoppingItemTombstone.user_id == user_id,
+        or_(ShoppingItemTombstone.id.in_(item_ids), ShoppingItemTombstone.deleted_at < now - TOMBSTONE_TTL),
+    ))
+    session.add_all(ShoppingItemTombstone(user_id=user_id, id=item_id, deleted_at=now) for item_id in item_ids)
+
+
+@instrument('db')
+class SQLStorage:
+    @staticmethod
+    async def get_user(user_id: str) -> Optional[Dict]:
+        async with await _session() as session:
+            row = await session.get(UserDocument, user_id)
+            return row.data | {'createdAt': row.created_at} if row else None
+
+    @staticmethod
+    async def create_user(user_id: str, user_data: Dict):
+        user_data['createdAt'] = datetime.utcnow()
+        data = {key: value for key, value in user_data.items() if key != 'createdAt'}
+        async with await _session() as session:
+            await session.merge(UserDocument(user_id=user_id, data=data, created_at=user_data['createdAt']))
+            await session.commit()
+        response_cache.invalidate(user_id, 'user')
+
+    @staticmethod
+    async def update_user(user_id: str, user_data: Dict):
+        async with await _session() as session:
+            row = await session.get(UserDocument, user_id)
+            if row is None:
+                raise ValueError(f"User {user_id} not found")
+            row.data = row.data | user_data
+            await session.commit()
+        response_cache.invalidate(user_id, 'user')
+
+    @staticmethod
+    async def get_user_preferences(user_id: str) -> Optional[Dict]:
+        async with await _session() as session:
+            row = await session.get(PreferencesDocument, user_id)
+            if row is None:
+                return None
+            return row.data | {'updatedAt': row.updated_at} if row.updated_at else row.data
+
+    @staticmethod
+    async def update_user_preferences(user_id: str, preferences: Dict):
+        async with await _session() as session:
+            row = await session.get(PreferencesDocument, user_id)
+            if row is None:
+                row = PreferencesDocument(user_id=user_id, data=preferences)
+                session.add(row)
+            else:
+                row.data = _merge(row.data, preferences)
+            row.updated_at = datetime.utcnow()
+            await session.commit()
+        response_cache.invalidate(user_id, 'preferences')
+
+    @staticmethod
+    async def get_meal_plan(user_id: str) -> Optional[Dict]:
+        async with await _session() as session:
+            row = await session.get(MealPlanDocument, user_id)
+            return {'plan': row.plan, 'updatedAt': row.updated_at} if row else None
+
+    @staticmethod
+    async def save_meal_plan(user_id: str, meal_plan: Dict):
+        async with await _session() as session:
+            await session.merge(MealPlanDocument(user_id=user_id, plan=meal_plan, updated_at=datetime.utcnow()))
+            await session.commit()
+        response_cache.invalidate(user_id, 'mealPlan', 'mealPlanSummary')
+
+    @staticmethod
+    async def get_shopping_list(user_id: str) -> List[Dict]:
+        async with await _session() as session:
+            rows = await session.exec(_items_query(user_id))
+            return [_item(row) | {'id': row.id} for row in rows]
+
+    @staticmethod
+    async def list_shopping_items(
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        checked: Optional[bool] = None,
+        category: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """One page of items in ``createdAt`` order, and the cursor of the next page (None on the last)."""
+        # Like a Firestore order_by, items without createdAt are left out
+        query = _items_query(user_id).where(ShoppingItemDocument.created_at.is_not(None))
+        if checked is not None:
+            query = query.where(ShoppingItemDocument.checked == checked)
+        if category is not None:
+            query = query.where(ShoppingItemDocument.category == category)
+        if cursor is not None:
+            created_at, item_id = decode_cursor(cursor)
+            query = query.where(or_(
+                ShoppingItemDocument.created_at > created_at,
+                and_(ShoppingItemDocument.created_at == created_at, ShoppingItemDocument.id > item_id),
+            ))
+        query = query.order_by(ShoppingItemDocument.created_at, ShoppingItemDocument.id).limit(limit + 1)
+        async with await _session() as session:
+            rows = await session.exec(query)
+            return paginate([_item(row) | {'id': row.id} for row in rows], limit, fields)
+
+    @staticmethod
+    async def add_shopping_item(user_id: str, item: Dict) -> str:
+        [item_id] = await SQLStorage.add_shopping_items(user_id, [item])
+        return item_id
+
+    @staticmethod
+    async def update_shopping_item(user_id: str, item_id: str, item: Dict):
+        await SQLStorage.update_shopping_items(user_id, [item | {'id': item_id}])
+
+    @staticmethod
+    async def delete_shopping_item(user_id: str, item_id: str):
+        await SQLStorage.delete_shopping_items(user_id, [item_id])
+
+    @staticmethod
+    async def add_shopping_items(user_id: str, items: List[Dict]) -> List[str]:
+        now = datetime.utcnow()
+        ids = []
+        async with await _session() as session:
+            for item in items:
+                row = ShoppingItemDocument(user_id=user_id, id=_new_id())
+                _set_item(row, item | {'createdAt': now, 'updatedAt': now})
+                session.add(row)
+                ids.append(row.id)
+            await session.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+        return ids
+
+    @staticmethod
+    async def update_shopping_items(user_id: str, items: List[Dict]):
+        """Apply partial updates; each item carries its document ``id``."""
+        now = datetime.utcnow()
+        async with await _session() as session:
+            rows = {row.id: row for row in await session.exec(
+                _items_query(user_id).where(ShoppingItemDocument.id.in_([item['id'] for item in items]))
+            )}
+            for item in items:
+                row = rows.get(item['id'])
+                if row is None:
+                    # Like a Firestore batch, nothing is written when one item is missing
+                    raise ValueError(f"Shopping item {item['id']} not found")
+                _set_item(row, _item(row) | item | {'updatedAt': now})
+            await session.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+
+    @staticmethod
+    async def delete_shopping_items(user_id: str, item_ids: List[str]):
+        async with await _session() as session:
+            await _delete_items(session, user_id, item_ids)
+            await session.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+
+    @staticmethod
+    async def get_shopping_items_by_source(user_id: str, source: str) -> Dict[str, Dict]:
+        async with await _session() as session:
+            rows = await session.exec(_items_query(user_id).where(ShoppingItemDocument.source == source))
+            return {row.id: _item(row) for row in rows}
+
+    @staticmethod
+    async def write_shopping_items(user_id: str, items: Dict[str, Dict], deleted_ids: List[str]):
+        """Replace the documents in ``items`` (keyed by id) and delete ``deleted_ids``, in one transaction."""
+        async with await _session() as session:
+            rows = {row.id: row for row in await session.exec(
+                _items_query(user_id).where(ShoppingItemDocument.id.in_(list(items)))
+            )}
+            for item_id, item in items.items():
+                row = rows.get(item_id)
+                if row is None:
+                    row = ShoppingItemDocument(user_id=user_id, id=item_id)
+                    session.add(row)
+                row.created_at = row.updated_at = None
+                _set_item(row, item)
+            if deleted_ids:
+                await _delete_items(session, user_id, deleted_ids)
+            await session.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+
+    @staticmethod
+    async def clear_shopping_list(user_id: str):
+        async with await _session() as session:
+            item_ids = list(await session.exec(
+                select(ShoppingItemDocument.id).where(ShoppingItemDocument.user_id == user_id)
+            ))
+            await _delete_items(session, user_id, item_ids)
+            await session.commit()
+        response_cache.invalidate(user_id, 'shoppingList')
+
+    @staticmethod
+    async def get_shopping_changes(user_id: str, since: datetime) -> Tuple[List[Dict], List[str]]:
+        """Items written after ``since`` and the ids of items deleted after it."""
+        async with await _session() as session:
+            rows = await session.exec(_items_query(user_id).where(ShoppingItemDocument.updated_at > since))
+            items = [_item(row) | {'id': row.id} for row in rows]
+            deleted = await session.exec(select(ShoppingItemTombstone.id).where(
+                ShoppingItemTombstone.user_id == user_id, ShoppingItemTombstone.deleted_at > since
+            ))
+            return items, list(deleted)
+
+
+storage = SQLStorage if STORAGE_BACKEND == "sql" else FirestoreDB
+
+
+async def init_storage():
+    """Connect the selected backend; called once per worker from the app lifespan."""
+    if STORAGE_BACKEND == "sql":
+        await create_sql_tables()
+    else:
+        await run_in_threadpool(init_firebase)
@@ -0,0 +1,66 @@
+"""Delta sync of the shopping list and preferences.
+
+A client keeps the ``syncedAt`` of its last sync and sends it back as
+``since``. The response then holds only what changed after it:
+
+* shopping items written after ``since`` (every write sets ``updatedAt``)
+* the ids of items deleted after it, from their tombstones
+* the preferences, when they were updated after it (otherwise null);
+  preferences saved before ``updatedAt`` was recorded count as changed
+
+Without ``since``, or with one older than the tombstone retention
+(``SYNC_TOMBSTONE_TTL_DAYS``), everything is returned with ``full: true``
+and the client replaces its copy.
+
+Timestamps come from the clock of whichever worker wrote them, so ``since``
+is moved back by ``SYNC_CLOCK_SKEW_SECONDS``. Writes in that window can be
+sent twice; applying a change again is harmless.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from firestore_db import TOMBSTONE_TTL
+from storage import storage
+
+SYNC_CLOCK_SKEW = timedelta(seconds=float(os.getenv("SYNC_CLOCK_SKEW_SECONDS", "1")))
+
+
+def preferences_payload(preferences: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The preferences as the client saved them, without the ``updatedAt`` sync bookkeeping."""
+    if preferences is None:
+        return None
+    return {key: value for key, value in preferences.items() if key != "updatedAt"}
+
+
+def _utc(value: datetime) -> datetime:
+    """Naive UTC, as the documents are written."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+async def sync_changes(user_id: str, since: Optional[datetime] = None) -> Dict[str, Any]:
+    synced_at = datetime.utcnow()
+    full = since is None or _utc(since) < synced_at - TOMBSTONE_TTL
+    if full:
+        items, preferences = await asyncio.gather(
+            storage.get_shopping_list(user_id), storage.get_user_preferences(user_id)
+        )
+        deleted = []
+    else:
+        since = _utc(since) - SYNC_CLOCK_SKEW
+        (items, deleted), preferences = await asyncio.gather(
+            storage.get_shopping_changes(user_id, since), storage.get_user_preferences(user_id)
+        )
+        # An item deleted and written again since (like a re-derived meal plan item) exists
+        written = {item["id"] for item in items}
+        deleted = [item_id for item_id in deleted if item_id not in written]
+        updated_at = (preferences or {}).get("updatedAt")
+        if updated_at is not None and _utc(updated_at) <= since:
+            preferences = None
+    return {
+        "syncedAt": synced_at,
+        "full": full,
+        "shoppingList": {"changed": items, "deleted": deleted},
+        "preferences": preferences_payload(preferences),
+    }
@@ -0,0 +1,162 @@
+"""Token budgeting and accounting for the meal plan completions.
+
+Prompt and completion sizes are measured with ``tiktoken``. The encoding is
+loaded during the app warm-up (``load_encoding``); the Docker image ships it
+so no download is needed. Only if it cannot be loaded are sizes estimated at
+about four characters per token, with a warning, as that can be off by a
+quarter. ``completion_budget`` sizes ``max_tokens`` from the
+number of days and meals requested, capped by what is left of the model's
+context window after the prompt.
+
+Every completion is recorded in ``token_accounting``. Inside
+``track_usage()`` it is also added to that block's ``TokenUsage``, which
+gives the tokens, completions and upstream seconds spent on one plan,
+including any per-day repair completions.
+"""
+import contextvars
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "8192"))
+# Expected completion size of one meal object; compare with the measured
+# completion_tokens_per_meal in token_accounting.stats() when tuning
+MEAL_PLAN_TOKENS_PER_MEAL = int(os.getenv("MEAL_PLAN_TOKENS_PER_MEAL", "300"))
+MEAL_PLAN_TOKEN_MARGIN = float(os.getenv("MEAL_PLAN_TOKEN_MARGIN", "1.2"))
+# Day keys, braces and the weeklyPlan wrapper
+TOKENS_PER_DAY = 8
+TOKENS_PER_PLAN = 10
+CHARS_PER_TOKEN = 4
+# Chat framing around each message and the reply, as counted by the API
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        # Imported on first use, off the cold start path
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        # Not installed, unknown model, or the encoding file cannot be downloaded
+        logger.warning(
+            "No tiktoken encoding for %s (%s); estimating token counts at %d characters per token",
+            model, e, CHARS_PER_TOKEN,
+        )
+        return None
+
+
+def load_encoding(model: str) -> bool:
+    """Load ``model``'s encoding ahead of the first count; False when counts will be estimated."""
+    return _encoding(model) is not None
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    return sum(TOKENS_PER_MESSAGE + count_tokens(message["content"], model) for message in messages) + TOKENS_PER_REPLY
+
+
+def completion_budget(days: int, meals: int, prompt_tokens: int) -> int:
+    """``max_tokens`` for a plan of ``days`` x ``meals``, leaving room for the prompt."""
+    expected = TOKENS_PER_PLAN + days * (TOKENS_PER_DAY + meals * MEAL_PLAN_TOKENS_PER_MEAL)
+    return max(1, min(math.ceil(expected * MEAL_PLAN_TOKEN_MARGIN), MODEL_CONTEXT_TOKENS - prompt_tokens))
+
+
+class TokenUsage:
+    def __init__(self):
+        self.completions = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.max_tokens = 0
+        self.truncated = 0
+        self.seconds = 0.0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, max_tokens: int, truncated: bool, seconds: float):
+        self.completions += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.max_tokens += max_tokens
+        self.truncated += int(truncated)
+        self.seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "completions": self.completions,
+            "promptTokens": self.prompt_tokens,
+            "completionTokens": self.completion_tokens,
+            "maxTokens": self.max_tokens,
+            "truncated": self.truncated,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+_current_usage: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar(
+    "meal_plan_token_usage", default=None
+)
+
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    """Collect the usage of every completion made inside the block (and tasks it starts)."""
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _current_usage.reset(token)
+        except ValueError:
+            # A streamed response abandoned by the client is closed from another context
+            pass
+
+
+class TokenAccounting:
+    def __init__(self):
+        self.total = TokenUsage()
+        self.meals = 0
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        max_tokens: int,
+        finish_reason: Optional[str],
+        seconds: float,
+        meals: int = 0,
+    ):
+        truncated = finish_reason == "length"
+        with self._lock:
+            self.total.add(prompt_tokens, completion_tokens, max_tokens, truncated, seconds)
+            self.meals += meals
+        usage = _current_usage.get()
+        if usage is not None:
+            usage.add(prompt_tokens, completion_tokens, max_tokens, truncated, seconds)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.total
+        return {
+            "completions": total.completions,
+            "prompt_tokens": total.prompt_tokens,
+            "completion_tokens": total.completion_tokens,
+            "truncated": total.truncated,
+            "completion_tokens_per_meal": total.completion_tokens / self.meals if self.meals else 0.0,
+            "max_tokens_utilization": total.completion_tokens / total.max_tokens if total.max_tokens else 0.0,
+        }
+
+
+token_accounting = TokenAccounting()
@@ -1,3 +1,6 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -5,9 +8,10 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.hash import bcrypt
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
+from database import get_async_session
 from models import User
 
 # Security configuration
@@ -15,6 +19,15 @@ SECRET_KEY = "your-secret-key-here"  # In production, use a secure secret key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt cost factor; hashes made with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads hashing passwords, per worker. bcrypt releases the GIL, so hashes
+# run in parallel and the event loop keeps serving other requests meanwhile.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+password_hasher = bcrypt.using(rounds=BCRYPT_ROUNDS)
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class Token(BaseModel):
@@ -24,18 +37,25 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, password_hasher.verify, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return bcrypt.hash(password)
+async def get_password_hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, password_hasher.hash, password)
 
-def authenticate_user(email: str, password: str, session: Session) -> Optional[User]:
-    user = session.exec(select(User).where(User.email == email)).first()
+async def authenticate_user(email: str, password: str, session: AsyncSession) -> Optional[User]:
+    user = (await session.exec(select(User).where(User.email == email))).first()
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None
+    if password_hasher.needs_update(user.hashed_password):
+        # BCRYPT_ROUNDS changed since this hash was made
+        user.hashed_password = await get_password_hash(password)
+        session.add(user)
+        await session.commit()
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -50,7 +70,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -66,7 +86,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = session.exec(select(User).where(User.email == token_data.email)).first()
+    user = (await session.exec(select(User).where(User.email == token_data.email))).first()
     if user is None:
         raise credentials_exception
     return user
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Login throughput with bcrypt hashing in the thread pool vs on the event loop.
+
+Registers ``--users`` users in a temporary SQLite database, then sends
+``--logins`` ``POST /token`` requests with ``--concurrency`` in flight and
+reports logins/second, logins/second per core and the event loop lag
+observed meanwhile:
+
+* ``pool``   - ``auth.hash_executor``: hashes run on PASSWORD_HASH_WORKERS threads
+* ``inline`` - hashes run on the event loop, as before the pool
+
+Usage (from ``backup/api``)::
+
+    python -m benchmarks.logins --rounds 12 --logins 100 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import Executor, Future
+
+import httpx
+
+
+class InlineExecutor(Executor):
+    """Runs each call on the submitting thread, blocking the event loop."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))] if ordered else 0.0
+
+
+async def watch_loop(lags, interval: float = 0.005):
+    """Record how late each ``interval`` sleep wakes up."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def login_burst(client: httpx.AsyncClient, emails, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def login(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post('/token', data={'username': emails[i % len(emails)], 'password': 'password'})
+            response.raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+    lags = []
+    watcher = asyncio.create_task(watch_loop(lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    watcher.cancel()
+    return samples, elapsed, lags
+
+
+async def run(args):
+    import auth
+    import main
+
+    cores = min(auth.PASSWORD_HASH_WORKERS, os.cpu_count() or 1)
+    pool = auth.hash_executor
+    emails = [f'user{i}@example.com' for i in range(args.users)]
+    print(f'rounds={auth.BCRYPT_ROUNDS} workers={auth.PASSWORD_HASH_WORKERS} cores={cores} '
+          f'logins={args.logins} concurrency={args.concurrency}')
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            await asyncio.gather(*(
+                client.post('/register', json={'email': email, 'name': 'Bench', 'password': 'password'})
+                for email in emails
+            ))
+            for mode, executor in (('pool', pool), ('inline', InlineExecutor())):
+                auth.hash_executor = executor
+                samples, elapsed, lags = await login_burst(client, emails, args.logins, args.concurrency)
+                rate = len(samples) / elapsed
+                mode_cores = cores if mode == 'pool' else 1
+                print(
+                    f'{mode:<8} logins/s={rate:>7.1f} per core={rate / mode_cores:>7.1f} '
+                    f'p50={statistics.median(samples) * 1000:>8.1f}ms p99={percentile(samples, 99) * 1000:>8.1f}ms '
+                    f'loop lag p99={percentile(lags, 99) * 1000:>7.1f}ms max={max(lags, default=0) * 1000:>7.1f}ms'
+                )
+            auth.hash_executor = pool
+
+
+def main(args):
+    if args.rounds:
+        os.environ['BCRYPT_ROUNDS'] = str(args.rounds)
+    with tempfile.TemporaryDirectory() as directory:
+        # database.py keeps its SQLite file in the working directory
+        os.chdir(directory)
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, help='BCRYPT_ROUNDS (default: the configured cost)')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    main(parser.parse_args())
@@ -1,5 +1,7 @@
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from typing import AsyncGenerator, Generator, Optional
 import os
 
 # Database configuration
@@ -13,21 +15,35 @@ INSTANCE_UNIX_SOCKET = os.getenv("DB_HOST", "")
 
 if INSTANCE_UNIX_SOCKET:
     DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@/{DB_NAME}?host={DB_HOST}"
+    ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@/{DB_NAME}?host={DB_HOST}"
 else:
     # Local development fallback
     DATABASE_URL = "sqlite:///./vital_bites.db"
+    ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./vital_bites.db"
 
-# Create engine with connection pooling
+# Connection pool per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQL_ECHO = os.getenv("SQL_ECHO", "").lower() in ("1", "true")
+
+# Sync engine for scripts and create_db_and_tables
 engine = create_engine(
     DATABASE_URL,
-    pool_size=5,
-    max_overflow=2,
-    pool_timeout=30,
-    pool_recycle=1800,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-    echo=True  # Enable SQL query logging
+    echo=SQL_ECHO
 )
 
+# Async engine for the endpoints, so a query never blocks the event loop.
+# Created and disposed of by the app lifespan.
+async_engine: Optional[AsyncEngine] = None
+async_session_factory: Optional[async_sessionmaker] = None
+
 def create_db_and_tables():
     """Initialize the database and create all tables"""
     try:
@@ -47,4 +63,42 @@ def get_session() -> Generator[Session, None, None]:
             session.rollback()
             raise
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+
+def init_async_engine() -> AsyncEngine:
+    global async_engine, async_session_factory
+    if async_engine is None:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            echo=SQL_ECHO
+        )
+        async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+    return async_engine
+
+async def close_async_engine():
+    global async_engine, async_session_factory
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+        async_session_factory = None
+
+async def create_db_and_tables_async():
+    """Initialize the database and create all tables on the async engine"""
+    async with init_async_engine().begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Get an async database session"""
+    init_async_engine()
+    async with async_session_factory() as session:
+        try:
+            yield session
+        except Exception as e:
+            print(f"Session error: {e}")
+            await session.rollback()
+            raise
@@ -1,28 +1,36 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Session, select, SQLModel
+from contextlib import asynccontextmanager
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 import uvicorn
 import json
 
-from database import engine, get_session, create_db_and_tables
+from database import close_async_engine, create_db_and_tables_async, get_async_session
 from models import Recipe, RecipeCreate, RecipeRead, User, UserCreate, UserPreferences
 from auth import (
     get_current_user,
     create_access_token,
     authenticate_user,
     get_password_hash,
+    hash_executor,
     Token,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from openai_service import generate_meal_plan
 from fastapi.security import OAuth2PasswordRequestForm
 
-# Initialize database
-create_db_and_tables()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The connection pool is created per worker, on its event loop
+    await create_db_and_tables_async()
+    yield
+    await close_async_engine()
+    hash_executor.shutdown(wait=False)
 
-app = FastAPI(title="Vital Bites API")
+app = FastAPI(title="Vital Bites API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -34,9 +42,9 @@ app.add_middleware(
 )
 
 @app.post("/register", response_model=User)
-def register_user(user: UserCreate, session: Session = Depends(get_session)):
+async def register_user(user: UserCreate, session: AsyncSession = Depends(get_async_session)):
     # Check if user already exists
-    db_user = session.exec(select(User).where(User.email == user.email)).first()
+    db_user = (await session.exec(select(User).where(User.email == user.email))).first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -44,23 +52,23 @@ def register_user(user: UserCreate, session: Session = Depends(get_session)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         email=user.email,
         name=user.name,
         hashed_password=hashed_password
     )
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return db_user
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    user = authenticate_user(form_data.username, form_data.password, session)
+    user = await authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,